@@ -0,0 +1,8 @@
+import os
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = 'test'
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+EMAIL_URL = 'http://localhost'
@@ -115,6 +115,37 @@ POSTS_ON_PAGE = 10
 TASKS_ON_PAGE = 20
 USERS_ON_PAGE = 30
 
+RATING_SYSTEM = 'website.rating_system.VectorizedRatingSystem'
+
+FINISHED_SCOREBOARD_TTL = 86400
+# Every open scoreboard stream holds a worker, only enable it with async workers (gunicorn -k gevent),
+# otherwise the scoreboard page polls for updates every SCOREBOARD_POLL_INTERVAL seconds
+SCOREBOARD_STREAM_ENABLED = False
+SCOREBOARD_STREAM_KEEPALIVE = 15
+SCOREBOARD_STREAMS_PER_USER = 2
+SCOREBOARD_STREAM_SLOT_TIMEOUT = 3600
+SCOREBOARD_POLL_INTERVAL = 10
+
+SIDEBAR_CACHE_TIMEOUT = 300
+CONTEST_CACHE_TIMEOUT = 3600
+OBJECT_PERMISSIONS_CACHE_TIMEOUT = 3600
+TAG_IDS_CACHE_TIMEOUT = 3600
+
+FLAG_CACHE_TIMEOUT = 3600
+SOLVED_TASKS_CACHE_TIMEOUT = 86400
+
+FLAG_SUBMISSION_LIMIT = 10
+FLAG_SUBMISSION_PERIOD = 60
+
+SUBMISSION_FLUSH_BATCH_SIZE = 500
+SUBMISSION_FLUSH_LOCK_TIMEOUT = 300
+
+PAGE_CURSOR_TIMEOUT = 300
+PAGE_COUNT_CACHE_TIMEOUT = 3600
+
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 300
+TASKS_ARCHIVE_CACHE_TIMEOUT = 60
+
 DEFAULT_AVATAR_MAIN = '/media/avatars/default_avatar.main.png'
 DEFAULT_AVATAR_SMALL = '/media/avatars/default_avatar.small.png'
 
@@ -206,6 +237,12 @@ CELERY_ACCEPT_CONTENT = ['pickle']
 CELERY_IMPORTS = [
     'website.tasks'
 ]
+CELERY_BEAT_SCHEDULE = {
+    'flush-submissions': {
+        'task': 'website.tasks.flush_submissions',
+        'schedule': 10.0
+    }
+}
 
 """
     2.5MB - 2621440
@@ -224,9 +261,13 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 20971520
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'django.contrib.auth.backends.AllowAllUsersModelBackend',
-    'guardian.backends.ObjectPermissionBackend'
+    'website.permissions.CachedObjectPermissionBackend'
 ]
 
+# guardian.W001 looks for guardian.backends.ObjectPermissionBackend by its exact path,
+# CachedObjectPermissionBackend is a subclass of it
+SILENCED_SYSTEM_CHECKS = ['guardian.W001']
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -4,14 +4,14 @@ from django.contrib.admin.forms import AdminAuthenticationForm
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
-from django.db.models import Sum, Value as V
-from django.db.models.functions import Coalesce
 from django.utils.datetime_safe import datetime
 from django_mptt_admin.admin import DjangoMpttAdmin
 from guardian.admin import GuardedModelAdminMixin
 
-from .models import ContestTaskRelationship
+from . import page_cache, page_counts
+from .models import ContestTaskRelationship, RatingChange, Submission
 from .models import User, Post, Organization, Comment, Task, Contest
+from .tasks import refresh_user_scores, get_task_solvers
 
 
 class CustomAdminAuthenticationForm(AdminAuthenticationForm):
@@ -48,7 +48,7 @@ class CustomUserAdmin(GuardedModelAdminMixin, UserAdmin):
             'fields': ('last_login', 'date_joined')
         }),
         ('Ranking', {
-            'fields': ('cost_sum', 'rank', 'rating', 'max_rating')
+            'fields': ('score', 'solved_count', 'rank', 'rating', 'max_rating')
         }),
         ('Other info', {
             'fields': ('organization', 'country', 'city', 'avatar')
@@ -58,7 +58,7 @@ class CustomUserAdmin(GuardedModelAdminMixin, UserAdmin):
         })
     )
 
-    readonly_fields = ('cost_sum',)
+    readonly_fields = ('score', 'solved_count')
 
     filter_horizontal = ('groups', 'user_permissions', 'friends')
 
@@ -70,15 +70,6 @@ class CustomUserAdmin(GuardedModelAdminMixin, UserAdmin):
         self.list_display_links = ('id', 'username')
         super(CustomUserAdmin, self).__init__(model, admin_site)
 
-    def cost_sum(self, obj):
-        return obj.cost_sum
-
-    cost_sum.short_description = 'Cost_sum'
-
-    def get_queryset(self, request):
-        qs = super(CustomUserAdmin, self).get_queryset(request)
-        return qs.annotate(cost_sum=Coalesce(Sum('solved_tasks__cost'), V(0)))
-
 
 class CustomGroupAdmin(admin.ModelAdmin):
     ordering = ('id',)
@@ -124,12 +115,20 @@ class TaskContestInlineAdmin(admin.TabularInline):
 class TaskAdmin(CustomModelAdmin):
 
     def unpublish_tasks(self, request, queryset):
+        task_ids = list(queryset.values_list('id', flat=True))
         queryset.update(is_published=False)
+        refresh_user_scores(get_task_solvers(task_ids))
+        page_counts.invalidate_counts(page_counts.TASKS_ARCHIVE)
+        page_cache.bump_generation()
 
     unpublish_tasks.short_description = 'Unpublish tasks'
 
     def publish_tasks(self, request, queryset):
-        queryset.update(is_published=True, publication_time=datetime.now())
+        task_ids = list(queryset.filter(is_published=False).values_list('id', flat=True))
+        queryset.filter(id__in=task_ids).update(is_published=True, publication_time=datetime.now())
+        refresh_user_scores(get_task_solvers(task_ids))
+        page_counts.invalidate_counts(page_counts.TASKS_ARCHIVE)
+        page_cache.bump_generation()
 
     publish_tasks.short_description = 'Publish tasks'
 
@@ -162,3 +161,5 @@ custom_admin_site.register(Comment, CommentAdmin)
 custom_admin_site.register(Task, TaskAdmin)
 custom_admin_site.register(Contest, ContestAdmin)
 custom_admin_site.register(Group, CustomGroupAdmin)
+custom_admin_site.register(RatingChange, CustomModelAdmin)
+custom_admin_site.register(Submission, CustomModelAdmin)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Contest
+
+
+def get_contest_key(contest_id):
+    return 'contest:{}'.format(contest_id)
+
+
+def get_contest_record(contest_id):
+    """
+    Returns the contest from the cache, it is kept until the contest is saved or deleted.
+    Returns None if there is no such contest.
+    """
+    key = get_contest_key(contest_id)
+    contest = cache.get(key)
+    if contest is None:
+        contest = Contest.objects.filter(id=contest_id).first() or False
+        cache.set(key, contest, settings.CONTEST_CACHE_TIMEOUT)
+    return contest or None
+
+
+def forget_contest(contest_id):
+    cache.delete(get_contest_key(contest_id))
+
+
+def is_public(contest):
+    return contest.is_published and (contest.is_running or contest.is_finished)
+
+
+def get_visible_contest(request, contest_id):
+    """
+    Returns the contest if the user of the request can view it, otherwise None.
+    Permissions are only checked for contests that are not public, the result
+    is remembered for the rest of the request.
+    """
+    visible_contests = request.__dict__.setdefault('_visible_contests', {})
+    if contest_id not in visible_contests:
+        contest = get_contest_record(contest_id)
+        if contest and not is_public(contest) and not request.user.has_perm('view_unstarted_contest', contest):
+            contest = None
+        visible_contests[contest_id] = contest
+    return visible_contests[contest_id]
@@ -1,25 +1,31 @@
-from django.db.models import Sum, Value as V, Q
-from django.db.models.functions import Coalesce
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
-from .models import User, Contest
+get_model = apps.get_model
 
+TOP_USERS_CACHE_KEY = 'sidebar:top_users'
+UPCOMING_CONTESTS_CACHE_KEY = 'sidebar:upcoming_contests'
+RUNNING_CONTESTS_CACHE_KEY = 'sidebar:running_contests'
 
-def top_users(request):
-    users = User.objects.filter(
+
+def invalidate_sidebar_cache(*keys):
+    cache.delete_many(keys)
+
+
+def lazy_cached(key, getter):
+    return SimpleLazyObject(lambda: cache.get_or_set(key, getter, settings.SIDEBAR_CACHE_TIMEOUT))
+
+
+def get_top_users():
+    return list(get_model('website', 'User').objects.filter(
         is_active=True
     ).exclude(
         username='AnonymousUser'
     ).exclude(
         groups__name='Administrators'
-    ).annotate(
-        cost_sum=Coalesce(
-            Sum(
-                'solved_tasks__cost',
-                filter=Q(solved_tasks__is_published=True),
-            ),
-            V(0)
-        )
     ).only(
         'username',
         'rank',
@@ -28,25 +34,33 @@ def top_users(request):
         '-rating',
         'last_solve',
         'id'
-    ).all()[:10]
-
-    return {'top_users': users}
+    ).all()[:10])
 
 
-def upcoming_contests(request):
+def get_upcoming_contests():
     min_time = timezone.now()
     max_time = min_time + timezone.timedelta(weeks=2)
-    contests = Contest.objects.filter(
+    return list(get_model('website', 'Contest').objects.filter(
         start_time__gt=min_time,
         start_time__lte=max_time,
         is_published=True
-    ).all()
-    return {'upcoming_contests': contests}
+    ).all())
 
 
-def running_contests(request):
-    contests = Contest.objects.filter(
+def get_running_contests():
+    return list(get_model('website', 'Contest').objects.filter(
         is_running=True,
         is_published=True
-    ).all()
-    return {'running_contests': contests}
+    ).all())
+
+
+def top_users(request):
+    return {'top_users': lazy_cached(TOP_USERS_CACHE_KEY, get_top_users)}
+
+
+def upcoming_contests(request):
+    return {'upcoming_contests': lazy_cached(UPCOMING_CONTESTS_CACHE_KEY, get_upcoming_contests)}
+
+
+def running_contests(request):
+    return {'running_contests': lazy_cached(RUNNING_CONTESTS_CACHE_KEY, get_running_contests)}
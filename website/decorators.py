@@ -12,7 +12,7 @@ def custom_login_required(f):
             if request.is_ajax():
                 return HttpResponse('Unauthorized', status=401)
             else:
-                path = request.build_full_path()
+                path = request.get_full_path()
                 redirect_field_name = 'next'
                 return redirect_to_login(path, settings.LOGIN_URL, redirect_field_name)
         return f(request, *args, **kwargs)
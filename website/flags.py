@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import re
+from functools import lru_cache
+
+
+def get_digest(flag):
+    return hashlib.sha256(flag.encode()).hexdigest()
+
+
+class FlagMatcher:
+    """
+    Matchers are built from the prepared flag, which is what gets cached, so matchers
+    that can work with digests never keep the plain flag.
+    """
+
+    @staticmethod
+    def prepare(flag):
+        return flag
+
+
+class ExactMatcher(FlagMatcher):
+    @staticmethod
+    def prepare(flag):
+        return get_digest(flag)
+
+    def __init__(self, prepared):
+        self.digest = prepared.encode()
+
+    def match(self, flag, user_id):
+        return hmac.compare_digest(self.digest, get_digest(flag).encode())
+
+
+class CaseInsensitiveMatcher(ExactMatcher):
+    @staticmethod
+    def prepare(flag):
+        return get_digest(flag.lower())
+
+    def match(self, flag, user_id):
+        return super(CaseInsensitiveMatcher, self).match(flag.lower(), user_id)
+
+
+class MultipleMatcher(FlagMatcher):
+    """
+    Accepts any of the whitespace separated flags.
+    """
+
+    @staticmethod
+    def prepare(flag):
+        return ' '.join(sorted(get_digest(one_flag) for one_flag in flag.split()))
+
+    def __init__(self, prepared):
+        self.digests = frozenset(prepared.split())
+
+    def match(self, flag, user_id):
+        return get_digest(flag) in self.digests
+
+
+class RegexMatcher(FlagMatcher):
+    """
+    Task.clean rejects invalid patterns, one saved bypassing it never matches.
+    """
+
+    def __init__(self, flag):
+        try:
+            self.pattern = re.compile(flag)
+        except re.error:
+            self.pattern = None
+
+    def match(self, flag, user_id):
+        return self.pattern is not None and self.pattern.fullmatch(flag) is not None
+
+
+class DynamicMatcher(FlagMatcher):
+    """
+    The task flag is a secret, every user has own flag get_dynamic_flag(secret, user_id),
+    so checkers and task services can generate it without storing anything.
+    """
+
+    def __init__(self, flag):
+        self.secret = flag.encode()
+
+    def match(self, flag, user_id):
+        return hmac.compare_digest(get_dynamic_flag(self.secret, user_id).encode(), flag.encode())
+
+
+def get_dynamic_flag(secret, user_id):
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return hmac.new(secret, str(user_id).encode(), hashlib.sha256).hexdigest()
+
+
+FLAG_MATCHERS = {
+    'exact': ExactMatcher,
+    'iexact': CaseInsensitiveMatcher,
+    'multiple': MultipleMatcher,
+    'regex': RegexMatcher,
+    'dynamic': DynamicMatcher,
+}
+
+
+def prepare_flag(flag_type, flag):
+    return FLAG_MATCHERS[flag_type].prepare(flag)
+
+
+@lru_cache(maxsize=1024)
+def get_prepared_matcher(flag_type, prepared):
+    """
+    Matchers are built once per process for every distinct flag, so regexes are not recompiled per request.
+    """
+    return FLAG_MATCHERS[flag_type](prepared)
+
+
+def get_matcher(flag_type, flag):
+    return get_prepared_matcher(flag_type, prepare_flag(flag_type, flag))
@@ -192,7 +192,7 @@ class TaskForm(forms.ModelForm):
 
     class Meta:
         model = Task
-        fields = ('name', 'description', 'flag', 'cost', 'is_published')
+        fields = ('name', 'description', 'flag', 'flag_type', 'cost', 'is_published')
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
@@ -201,6 +201,10 @@ class TaskForm(forms.ModelForm):
             raise Exception('request.user was somehow None')
 
         super(TaskForm, self).__init__(*args, **kwargs)
+        self.fields['flag_type'].required = False
+
+    def clean_flag_type(self):
+        return self.cleaned_data.get('flag_type') or self.instance.flag_type
 
     def save(self, commit=True):
         task = super(TaskForm, self).save(commit=False)
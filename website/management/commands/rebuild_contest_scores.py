@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from website import scoreboard
+from website.models import Contest
+from website.tasks import rebuild_contest_scores
+
+
+class Command(BaseCommand):
+    help = 'Recomputes ContestScore rows of the given contests from solved tasks and rebuilds their ' \
+           'scoreboards in Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('contest_ids', type=int, nargs='*')
+        parser.add_argument('--all', action='store_true', help='Rebuild every contest')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            contests = list(Contest.objects.all())
+        elif options['contest_ids']:
+            contests = list(Contest.objects.filter(id__in=options['contest_ids']))
+            missing = set(options['contest_ids']) - set(contest.id for contest in contests)
+            if missing:
+                raise CommandError('No contests with ids {}'.format(', '.join(map(str, sorted(missing)))))
+        else:
+            raise CommandError('Pass contest ids or --all')
+
+        for contest in contests:
+            rebuild_contest_scores(contest)
+            scoreboard.rebuild_scoreboard(contest)
+            if contest.is_finished:
+                scoreboard.expire_scoreboard(contest.id, settings.FINISHED_SCOREBOARD_TTL)
+
+        self.stdout.write(self.style.SUCCESS('Scores of {} contests rebuilt'.format(len(contests))))
@@ -0,0 +1,131 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from website import page_cache, page_counts
+from website.context_processors import invalidate_sidebar_cache, TOP_USERS_CACHE_KEY
+from website.models import User, Contest, RatingChange
+from website.tasks import get_contest_standings, calculate_rating_changes, save_rating_changes
+from website.tasks import update_integer_field
+
+
+class Command(BaseCommand):
+    help = 'Recalculates rating for the given contest and every contest finished after it. ' \
+           'Ratings before the contest are taken from stored rating changes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('contest_id', type=int)
+        parser.add_argument('--recompute-standings', action='store_true',
+                            help='Recompute places for all contests, not only for the given one')
+
+    def handle(self, *args, **options):
+        contest = Contest.objects.filter(id=options['contest_id'], is_finished=True).first()
+        if not contest:
+            raise CommandError('No finished contest with id {}'.format(options['contest_id']))
+
+        contests = list(Contest.objects.filter(
+            Q(end_time__gt=contest.end_time) | Q(end_time=contest.end_time, id__gte=contest.id),
+            is_finished=True
+        ).order_by(
+            'end_time',
+            'id'
+        ))
+
+        contests_with_changes = set(RatingChange.objects.filter(
+            contest__in=contests
+        ).values_list(
+            'contest_id',
+            flat=True
+        ).distinct())
+        for c in contests:
+            if c.id not in contests_with_changes:
+                raise CommandError(
+                    'Contest {} has no stored rating changes, ratings before it are unknown'.format(c.id)
+                )
+
+        standings = [self.get_standings(c, c == contest or options['recompute_standings']) for c in contests]
+        user_ids = set(user_id for contest_standings in standings for user_id in contest_standings)
+        ratings, max_ratings = self.get_snapshot(contests, user_ids)
+
+        all_changes = []
+        for c, contest_standings in zip(contests, standings):
+            self.stdout.write('Recalculating contest {} ({} participants)'.format(c.id, len(contest_standings)))
+            changes = calculate_rating_changes(c, contest_standings, ratings)
+            for change in changes:
+                ratings[change.user_id] = change.new_rating
+                max_ratings[change.user_id] = max(max_ratings[change.user_id], change.new_rating)
+            all_changes.append((c, changes))
+
+        with transaction.atomic():
+            for c, changes in all_changes:
+                save_rating_changes(c, changes)
+            update_integer_field(User, 'rating', list(ratings.items()))
+            update_integer_field(User, 'max_rating', list(max_ratings.items()))
+
+        invalidate_sidebar_cache(TOP_USERS_CACHE_KEY)
+        page_counts.forget_rating_top_cursors()
+        page_cache.bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Recalculated {} contests, {} users updated'.format(len(contests), len(user_ids))
+        ))
+
+    @staticmethod
+    def get_standings(contest, recompute):
+        if not recompute:
+            standings = list(RatingChange.objects.filter(
+                contest=contest
+            ).order_by(
+                'place'
+            ).values_list(
+                'user_id',
+                flat=True
+            ))
+            if standings:
+                return standings
+        return get_contest_standings(contest)
+
+    @staticmethod
+    def get_snapshot(contests, user_ids):
+        """
+        Returns ratings and max ratings of users right before the first recalculated contest:
+        the old rating stored for their first recalculated contest, then their latest stored
+        rating from earlier contests, then the default rating for users without history.
+        Max ratings are rebuilt from the same history, starting from the default rating.
+        """
+        default_rating = User._meta.get_field('rating').default
+        ratings = dict.fromkeys(user_ids, default_rating)
+        max_ratings = dict.fromkeys(user_ids, default_rating)
+
+        earlier_changes = RatingChange.objects.filter(
+            user_id__in=user_ids
+        ).exclude(
+            contest__in=contests
+        ).order_by(
+            'contest__end_time',
+            'contest_id'
+        ).values_list(
+            'user_id',
+            'new_rating'
+        )
+        for user_id, new_rating in earlier_changes:
+            ratings[user_id] = new_rating
+            max_ratings[user_id] = max(max_ratings[user_id], new_rating)
+
+        first_changes = RatingChange.objects.filter(
+            user_id__in=user_ids,
+            contest__in=contests
+        ).order_by(
+            '-contest__end_time',
+            '-contest_id'
+        ).values_list(
+            'user_id',
+            'old_rating'
+        )
+        for user_id, old_rating in first_changes:
+            ratings[user_id] = old_rating
+
+        for user_id, rating in ratings.items():
+            max_ratings[user_id] = max(max_ratings[user_id], rating)
+
+        return ratings, max_ratings
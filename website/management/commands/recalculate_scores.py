@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from website.models import User, Task
+from website.tasks import refresh_user_scores, refresh_task_solved_counts
+
+
+class Command(BaseCommand):
+    help = 'Recalculates stored score and solved task count of every user and solve count of every task ' \
+           'from solved tasks'
+
+    def handle(self, *args, **options):
+        refresh_user_scores(User.objects.all())
+        refresh_task_solved_counts(Task.objects.all())
+        self.stdout.write(self.style.SUCCESS('Scores of {} users and solve counts of {} tasks recalculated'.format(
+            User.objects.count(),
+            Task.objects.count()
+        )))
@@ -0,0 +1,34 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0058_auto_20190315_1323'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('place', models.IntegerField()),
+                ('old_rating', models.IntegerField()),
+                ('new_rating', models.IntegerField()),
+                ('delta', models.IntegerField()),
+                ('contest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to='website.Contest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('contest', 'place'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='ratingchange',
+            unique_together={('contest', 'user')},
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_contest_scores(apps, schema_editor):
+    Contest = apps.get_model('website', 'Contest')
+    ContestScore = apps.get_model('website', 'ContestScore')
+
+    for contest in Contest.objects.all():
+        participants = contest.participants.annotate(
+            cost_sum=models.Sum(
+                models.Case(
+                    models.When(
+                        contest_task_relationship__contest=contest,
+                        then='contest_task_relationship__cost'
+                    ),
+                    default=models.Value(0),
+                    output_field=models.IntegerField()
+                )
+            ),
+            solved_count=models.Count(
+                'contest_task_relationship',
+                filter=models.Q(contest_task_relationship__contest=contest)
+            )
+        ).values_list('id', 'cost_sum', 'solved_count', 'last_solve')
+
+        ContestScore.objects.bulk_create([
+            ContestScore(
+                contest=contest,
+                user_id=user_id,
+                points=points or 0,
+                solved_count=solved_count,
+                last_solve=last_solve if solved_count else None
+            )
+            for user_id, points, solved_count, last_solve in participants
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0059_ratingchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContestScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0)),
+                ('solved_count', models.IntegerField(default=0)),
+                ('last_solve', models.DateTimeField(blank=True, null=True)),
+                ('contest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='website.Contest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contest_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contestscore',
+            index=models.Index(fields=['contest', '-points', 'last_solve'], name='website_con_contest_39925f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='contestscore',
+            unique_together={('contest', 'user')},
+        ),
+        migrations.RunPython(fill_contest_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:20
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0060_contestscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='celery_freeze_task_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='scoreboard_freeze',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:23
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_user_scores(apps, schema_editor):
+    User = apps.get_model('website', 'User')
+    Task = apps.get_model('website', 'Task')
+
+    solved = Task.solved_by.through.objects.filter(
+        user_id=models.OuterRef('id'),
+        task__is_published=True
+    ).order_by().values('user_id')
+
+    User.objects.update(
+        score=Coalesce(
+            models.Subquery(solved.annotate(total=models.Sum('task__cost')).values('total'),
+                            output_field=models.IntegerField()),
+            models.Value(0)
+        ),
+        solved_count=Coalesce(
+            models.Subquery(solved.annotate(total=models.Count('task_id')).values('total'),
+                            output_field=models.IntegerField()),
+            models.Value(0)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0061_contest_scoreboard_freeze'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='solved_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-score', 'last_solve', 'id'], name='website_use_score_f4ab94_idx'),
+        ),
+        migrations.RunPython(fill_user_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0063_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='flag_type',
+            field=models.CharField(choices=[('exact', 'Exact'), ('iexact', 'Case insensitive'), ('multiple', 'Any of space separated flags'), ('regex', 'Regular expression'), ('dynamic', 'Dynamic (per user HMAC of the flag as a secret)')], default='exact', max_length=10),
+        ),
+    ]
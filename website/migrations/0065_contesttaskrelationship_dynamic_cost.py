@@ -0,0 +1,53 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:29
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_solved_counts(apps, schema_editor):
+    ContestTaskRelationship = apps.get_model('website', 'ContestTaskRelationship')
+    solved = ContestTaskRelationship.solved.through.objects.filter(
+        contesttaskrelationship_id=models.OuterRef('id')
+    ).order_by().values('contesttaskrelationship_id')
+
+    ContestTaskRelationship.objects.update(solved_count=Coalesce(
+        models.Subquery(solved.annotate(total=models.Count('user_id')).values('total'),
+                        output_field=models.IntegerField()),
+        models.Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0064_task_flag_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contesttaskrelationship',
+            name='decay',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contesttaskrelationship',
+            name='initial_cost',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contesttaskrelationship',
+            name='is_dynamic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='contesttaskrelationship',
+            name='min_cost',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contesttaskrelationship',
+            name='solved_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_solved_counts, migrations.RunPython.noop),
+    ]
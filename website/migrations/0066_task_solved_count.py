@@ -0,0 +1,33 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:41
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_solved_counts(apps, schema_editor):
+    Task = apps.get_model('website', 'Task')
+    solved = Task.solved_by.through.objects.filter(
+        task_id=models.OuterRef('id')
+    ).order_by().values('task_id')
+
+    Task.objects.update(solved_count=Coalesce(
+        models.Subquery(solved.annotate(total=models.Count('user_id')).values('total'),
+                        output_field=models.IntegerField()),
+        models.Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0065_contesttaskrelationship_dynamic_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='solved_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_solved_counts, migrations.RunPython.noop),
+    ]
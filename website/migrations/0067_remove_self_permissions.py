@@ -0,0 +1,62 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+SELF_PERMISSIONS = ('view_tasks_archive', 'view_contests_archive')
+
+
+def remove_self_permissions(apps, schema_editor):
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    content_type = ContentType.objects.filter(app_label='website', model='user').first()
+    if not content_type:
+        return
+
+    self_permissions = UserObjectPermission.objects.annotate(
+        user_pk=Cast('user_id', models.CharField())
+    ).filter(
+        content_type=content_type,
+        object_pk=models.F('user_pk'),
+        permission__codename__in=SELF_PERMISSIONS
+    )
+    UserObjectPermission.objects.filter(id__in=self_permissions.values('id')).delete()
+
+
+def restore_self_permissions(apps, schema_editor):
+    User = apps.get_model('website', 'User')
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    Permission = apps.get_model('auth', 'Permission')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    content_type = ContentType.objects.filter(app_label='website', model='user').first()
+    if not content_type:
+        return
+
+    for permission in Permission.objects.filter(content_type=content_type, codename__in=SELF_PERMISSIONS):
+        existing = set(UserObjectPermission.objects.filter(
+            content_type=content_type,
+            permission=permission
+        ).values_list(
+            'user_id',
+            'object_pk'
+        ))
+        UserObjectPermission.objects.bulk_create([
+            UserObjectPermission(user_id=user_id, permission=permission, content_type=content_type,
+                                 object_pk=str(user_id))
+            for user_id in User.objects.values_list('id', flat=True).iterator()
+            if (user_id, str(user_id)) not in existing
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guardian', '0001_initial'),
+        ('website', '0066_task_solved_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_self_permissions, restore_self_permissions),
+    ]
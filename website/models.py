@@ -1,15 +1,22 @@
+import math
+import re
+from datetime import timedelta
+
 from celery import current_app
 from django.contrib.auth.models import AbstractUser, Group
 from django.contrib.auth.validators import ASCIIUsernameValidator
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 from django.utils.datetime_safe import datetime
 from django_countries.fields import CountryField
-from guardian.shortcuts import assign_perm
 from mptt.models import TreeForeignKey, MPTTModel
 from stdimage.models import StdImageField
 from stdimage.validators import MaxSizeValidator
 
-from website.tasks import start_contest, end_contest
+from website.tasks import start_contest, end_contest, freeze_scoreboard
+from . import page_cache, page_counts
 from .models_auxiliary import CustomUploadTo, CustomImageSizeValidator, CustomFileField, stdimage_processor
 
 
@@ -20,6 +27,10 @@ class User(AbstractUser):
             ('view_contests_archive', 'Can view user\'s contests archive'),
         )
 
+        indexes = [
+            models.Index(fields=['-score', 'last_solve', 'id']),
+        ]
+
     username_validator = ASCIIUsernameValidator()
 
     organization = models.ForeignKey(
@@ -34,6 +45,9 @@ class User(AbstractUser):
     rating = models.IntegerField(blank=False, default=2000)
     max_rating = models.IntegerField(blank=False, default=2000)
 
+    score = models.IntegerField(blank=False, default=0)
+    solved_count = models.IntegerField(blank=False, default=0)
+
     country = CountryField(blank_label='(select country)', null=True, blank=True)
     city = models.CharField(max_length=256, blank=True)
     friends = models.ManyToManyField('User', related_name='befriended_by', blank=True, symmetrical=False)
@@ -67,14 +81,16 @@ class User(AbstractUser):
     def is_admin(self):
         return self.is_active and (self.is_staff or self.groups.filter(name='Administrators').exists())
 
+    # Permissions every user has for own profile, granted by CachedObjectPermissionBackend
+    SELF_PERMISSIONS = ('view_tasks_archive', 'view_contests_archive')
+
     def save(self, *args, **kwargs):
         super(User, self).save(*args, **kwargs)
-        if self.is_staff:
+        update_fields = kwargs.get('update_fields')
+        if self.is_staff and (update_fields is None or 'is_staff' in update_fields):
             if not self.groups.filter(name='Administrators').exists():
                 administrators = Group.objects.get(name='Administrators')
                 self.groups.add(administrators)
-        assign_perm('view_tasks_archive', self, self)
-        assign_perm('view_contests_archive', self, self)
 
 
 class Post(models.Model):
@@ -128,12 +144,22 @@ class Task(models.Model):
             ('view_who_solved_task', 'Can view list of users who solved task'),
         )
 
+    FLAG_TYPES = (
+        ('exact', 'Exact'),
+        ('iexact', 'Case insensitive'),
+        ('multiple', 'Any of space separated flags'),
+        ('regex', 'Regular expression'),
+        ('dynamic', 'Dynamic (per user HMAC of the flag as a secret)'),
+    )
+
     author = models.ForeignKey('User', on_delete=models.SET_NULL, related_name='tasks', blank=True, null=True)
     name = models.CharField(max_length=100, null=False, blank=False)
     description = models.TextField(blank=False, null=True)
     flag = models.CharField(max_length=100, null=False, blank=False)
+    flag_type = models.CharField(max_length=10, choices=FLAG_TYPES, default='exact')
 
     solved_by = models.ManyToManyField('User', related_name='solved_tasks', blank=True)
+    solved_count = models.IntegerField(default=0)
 
     cost = models.IntegerField(null=False, blank=False, default=50)
 
@@ -142,10 +168,20 @@ class Task(models.Model):
 
     tags = models.ManyToManyField('TaskTag', related_name='tasks', blank=True)
 
+    def clean(self):
+        if self.flag_type == 'regex' and self.flag:
+            try:
+                re.compile(self.flag)
+            except re.error as e:
+                raise ValidationError({'flag': 'Invalid regular expression: {}'.format(e)})
+
     def save(self, *args, **kwargs):
+        old = None
 
         if self.id:
-            old = Task.objects.only('is_published').get(id=self.id)
+            old = Task.objects.only('is_published', 'cost', 'solved_count').get(id=self.id)
+            # the counter is maintained by UPDATEs, do not write back a stale value
+            self.solved_count = old.solved_count
             if not old.is_published and self.is_published:
                 self.publication_time = datetime.now()
         else:
@@ -154,6 +190,19 @@ class Task(models.Model):
 
         super(Task, self).save(*args, **kwargs)
 
+        if self.is_published or (old and old.is_published):
+            page_cache.bump_generation()
+
+        if old:
+            score_delta = self.cost * self.is_published - old.cost * old.is_published
+            count_delta = self.is_published - old.is_published
+            if score_delta or count_delta:
+                User.objects.filter(solved_tasks=self).update(
+                    score=F('score') + score_delta,
+                    solved_count=F('solved_count') + count_delta
+                )
+                page_counts.forget_cursors(page_counts.USERS_TOP)
+
 
 class Contest(models.Model):
     class Meta:
@@ -184,18 +233,34 @@ class Contest(models.Model):
     is_finished = models.BooleanField(default=False)
     is_registration_open = models.BooleanField(default=False)
 
+    scoreboard_freeze = models.DurationField(default=timedelta(0))
+
     celery_start_task_id = models.CharField(max_length=50, null=True, blank=True)
     celery_end_task_id = models.CharField(max_length=50, null=True, blank=True)
+    celery_freeze_task_id = models.CharField(max_length=50, null=True, blank=True)
+
+    @property
+    def freeze_time(self):
+        if not self.scoreboard_freeze:
+            return None
+        return self.end_time - self.scoreboard_freeze
+
+    @property
+    def is_scoreboard_frozen(self):
+        return self.is_running and self.freeze_time is not None and timezone.now() >= self.freeze_time
 
     def save(self, *args, **kwargs):
         add_start_task = False
         add_end_task = False
+        add_freeze_task = False
 
         if self.id:
             old = Contest.objects.only('celery_start_task_id',
                                        'celery_end_task_id',
+                                       'celery_freeze_task_id',
                                        'start_time',
-                                       'end_time').get(id=self.id)
+                                       'end_time',
+                                       'scoreboard_freeze').get(id=self.id)
 
             if old.start_time != self.start_time:
                 current_app.control.revoke(old.celery_start_task_id)
@@ -207,6 +272,13 @@ class Contest(models.Model):
                 result = end_contest.apply_async(args=(self.id,), eta=self.end_time)
                 self.celery_end_task_id = result.id
 
+            if old.end_time != self.end_time or old.scoreboard_freeze != self.scoreboard_freeze:
+                current_app.control.revoke(old.celery_freeze_task_id)
+                self.celery_freeze_task_id = None
+                if self.freeze_time:
+                    result = freeze_scoreboard.apply_async(args=(self.id,), eta=self.freeze_time)
+                    self.celery_freeze_task_id = result.id
+
         else:
             if self.start_time != datetime.fromtimestamp(2051222400):
                 add_start_task = True
@@ -214,6 +286,9 @@ class Contest(models.Model):
             if self.end_time != datetime.fromtimestamp(2051222400):
                 add_end_task = True
 
+            if self.freeze_time:
+                add_freeze_task = True
+
         super(Contest, self).save(*args, **kwargs)
 
         if add_start_task:
@@ -222,6 +297,9 @@ class Contest(models.Model):
         if add_end_task:
             result = end_contest.apply_async(args=(self.id,), eta=self.end_time)
             Contest.objects.filter(id=self.id).update(celery_end_task_id=result.id)
+        if add_freeze_task:
+            result = freeze_scoreboard.apply_async(args=(self.id,), eta=self.freeze_time)
+            Contest.objects.filter(id=self.id).update(celery_freeze_task_id=result.id)
 
 
 class File(models.Model):
@@ -264,3 +342,69 @@ class ContestTaskRelationship(models.Model):
     cost = models.IntegerField(default=0)
     tag = models.ForeignKey('TaskTag', on_delete=models.SET_NULL, related_name='contest_task_relationship',
                             null=True, blank=True)
+    solved_count = models.IntegerField(default=0)
+
+    # dynamic scoring: cost decays from initial_cost to min_cost, which is reached after decay solves
+    is_dynamic = models.BooleanField(default=False)
+    initial_cost = models.IntegerField(default=0)
+    min_cost = models.IntegerField(default=0)
+    decay = models.IntegerField(default=0)
+
+    def get_dynamic_cost(self, solved_count):
+        """
+        CTFd-style quadratic decay, the first solver gets initial_cost.
+        """
+        if self.decay <= 0:
+            return self.min_cost
+
+        solves = max(solved_count - 1, 0)
+        cost = self.initial_cost + (self.min_cost - self.initial_cost) * solves ** 2 / self.decay ** 2
+        return max(int(math.ceil(cost)), self.min_cost)
+
+    def save(self, *args, **kwargs):
+        if self.is_dynamic:
+            self.cost = self.get_dynamic_cost(self.solved_count)
+        super(ContestTaskRelationship, self).save(*args, **kwargs)
+
+
+class ContestScore(models.Model):
+    class Meta:
+        unique_together = ('contest', 'user')
+        indexes = [
+            models.Index(fields=['contest', '-points', 'last_solve']),
+        ]
+
+    contest = models.ForeignKey('Contest', on_delete=models.CASCADE, related_name='scores')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='contest_scores')
+    points = models.IntegerField(default=0)
+    solved_count = models.IntegerField(default=0)
+    last_solve = models.DateTimeField(null=True, blank=True)
+
+
+class RatingChange(models.Model):
+    class Meta:
+        unique_together = ('contest', 'user')
+        ordering = ('contest', 'place')
+
+    contest = models.ForeignKey('Contest', on_delete=models.CASCADE, related_name='rating_changes')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='rating_changes')
+    place = models.IntegerField()
+    old_rating = models.IntegerField()
+    new_rating = models.IntegerField()
+    delta = models.IntegerField()
+
+
+class Submission(models.Model):
+    class Meta:
+        ordering = ('-timestamp',)
+        indexes = [
+            models.Index(fields=['task', '-timestamp']),
+            models.Index(fields=['user', '-timestamp']),
+        ]
+
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='submissions')
+    task = models.ForeignKey('Task', on_delete=models.CASCADE, related_name='submissions')
+    contest = models.ForeignKey('Contest', on_delete=models.CASCADE, related_name='submissions', null=True, blank=True)
+    correct = models.BooleanField(default=False)
+    timestamp = models.DateTimeField()
+    ip = models.GenericIPAddressField(null=True, blank=True)
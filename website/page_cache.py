@@ -0,0 +1,44 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'page_cache:generation'
+
+
+def get_generation():
+    return cache.get_or_set(GENERATION_KEY, 0, None)
+
+
+def bump_generation():
+    """
+    Makes every cached page stale, called when tasks are published, contests start or
+    finish and ratings change.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def get_or_set(name, getter, timeout):
+    """
+    Caches a part of a page shared by all users until the generation changes.
+    """
+    return cache.get_or_set('page_cache:{}:{}'.format(get_generation(), name), getter, timeout)
+
+
+def get_page_key(request):
+    return 'page_cache:{}:{}:{}'.format(
+        get_generation(),
+        int(request.user_agent.is_mobile),
+        hashlib.md5(request.get_full_path().encode()).hexdigest()
+    )
+
+
+def get_page(request):
+    return cache.get(get_page_key(request))
+
+
+def set_page(request, response):
+    cache.set(get_page_key(request), response, settings.ANONYMOUS_PAGE_CACHE_TIMEOUT)
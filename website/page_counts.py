@@ -0,0 +1,77 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# List keys of paged views, {} is the id of the user, task or group the list belongs to.
+TASKS_ARCHIVE = 'tasks_archive'
+USER_TASKS = 'user_tasks:{}'
+TASK_SOLVED = 'task_solved:{}'
+USER_SOLVED_TASKS = 'user_solved_tasks:{}'
+USERS_TOP = 'users_top'
+USERS_RATING_TOP = 'users_rating_top'
+GROUP_USERS_RATING_TOP = 'users_rating_top:{}'
+FRIENDS = 'friends:{}'
+MAIN_POSTS = 'main_posts'
+USER_BLOG = 'user_blog:{}'
+FINISHED_CONTESTS = 'finished_contests'
+USER_CONTESTS = 'user_contests:{}'
+USER_FINISHED_CONTESTS = 'user_finished_contests:{}'
+
+
+def get_count_key(list_key):
+    return 'page_count:{}'.format(list_key)
+
+
+def get_count(queryset, list_key):
+    """
+    Returns the list size, it is counted once and kept until invalidate_counts
+    (PAGE_COUNT_CACHE_TIMEOUT is only a safety net).
+    """
+    return cache.get_or_set(get_count_key(list_key), queryset.count, settings.PAGE_COUNT_CACHE_TIMEOUT)
+
+
+def get_version_key(list_key):
+    # rating tops filtered by group are ordered like the whole rating top, they share its version
+    if list_key.startswith(GROUP_USERS_RATING_TOP.format('')):
+        list_key = USERS_RATING_TOP
+    return 'page_version:{}'.format(list_key)
+
+
+def get_version(list_key):
+    """
+    Returns a token of the current list state, page cursors are cached under it and
+    are dropped together with it when the list changes.
+    """
+    return cache.get_or_set(get_version_key(list_key), lambda: uuid.uuid4().hex, None)
+
+
+def invalidate_counts(*list_keys):
+    cache.delete_many([get_count_key(list_key) for list_key in list_keys] +
+                      [get_version_key(list_key) for list_key in list_keys])
+
+
+def forget_cursors(*list_keys):
+    """
+    Drops page cursors of lists whose ordering changed while their size did not.
+    """
+    cache.delete_many([get_version_key(list_key) for list_key in list_keys])
+
+
+def forget_rating_top_cursors():
+    forget_cursors(USERS_RATING_TOP)
+
+
+def forget_user_top_cursors():
+    """
+    Drops cursors of all user tops, they are ordered by last_solve after score or rating.
+    """
+    forget_cursors(USERS_TOP, USERS_RATING_TOP)
+
+
+def invalidate_user_list_counts():
+    """
+    Drops counts of the user tops, including the ones filtered by group.
+    """
+    invalidate_counts(USERS_TOP, USERS_RATING_TOP)
+    cache.delete_pattern(get_count_key(GROUP_USERS_RATING_TOP.format('*')))
@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from guardian.backends import ObjectPermissionBackend, check_support
+from guardian.ctypes import get_content_type
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
+
+def get_permissions_key(user_id, content_type_id):
+    return 'object_perms:{}:{}'.format(user_id, content_type_id)
+
+
+def get_object_permissions(user, content_type):
+    """
+    Returns {object_pk: set of codenames} with permissions of the user and the user's groups
+    for every object of the content type, loaded with one query and cached until
+    the permissions change.
+    """
+    key = get_permissions_key(user.id, content_type.id)
+    permissions = cache.get(key)
+    if permissions is None:
+        rows = UserObjectPermission.objects.filter(
+            user=user,
+            content_type=content_type
+        ).values_list(
+            'object_pk',
+            'permission__codename'
+        ).union(GroupObjectPermission.objects.filter(
+            group__user=user,
+            content_type=content_type
+        ).values_list(
+            'object_pk',
+            'permission__codename'
+        ))
+
+        permissions = dict()
+        for object_pk, codename in rows:
+            permissions.setdefault(object_pk, set()).add(codename)
+        cache.set(key, permissions, settings.OBJECT_PERMISSIONS_CACHE_TIMEOUT)
+    return permissions
+
+
+def get_perms(user, obj):
+    """
+    Returns codenames of object permissions the user has for obj, same as guardian's get_perms.
+    """
+    support, user = check_support(user, obj)
+    if not support or not user.is_active:
+        return set()
+
+    content_type = get_content_type(obj)
+    if user.is_superuser:
+        return set(Permission.objects.filter(content_type=content_type).values_list('codename', flat=True))
+
+    return get_loaded_perms(user, get_object_permissions(user, content_type), obj)
+
+
+def get_loaded_perms(user, object_permissions, obj):
+    perms = object_permissions.get(str(obj.pk), set())
+    if isinstance(obj, get_user_model()) and obj.pk == user.pk:
+        perms = perms.union(obj.SELF_PERMISSIONS)
+    return perms
+
+
+def filter_objects(user, perm, objects):
+    """
+    Returns objects of one model for which the user has the object permission,
+    checked against permissions loaded once instead of per object.
+    """
+    objects = list(objects)
+    if not objects:
+        return []
+
+    support, user = check_support(user, objects[0])
+    if not support or not user.is_active:
+        return []
+    if user.is_superuser:
+        return objects
+
+    object_permissions = get_object_permissions(user, get_content_type(objects[0]))
+    return [obj for obj in objects if perm in get_loaded_perms(user, object_permissions, obj)]
+
+
+def forget_permissions(user_id, content_type_id):
+    cache.delete(get_permissions_key(user_id, content_type_id))
+
+
+def forget_all_permissions(user_id='*', content_type_id='*'):
+    cache.delete_pattern(get_permissions_key(user_id, content_type_id))
+
+
+class CachedObjectPermissionBackend(ObjectPermissionBackend):
+    """
+    Guardian backend answering from the cached permissions of the user instead of
+    querying guardian tables for every checked object.
+    """
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if '.' in perm:
+            app_label, perm = perm.split('.', 1)
+            if obj is not None and app_label != get_content_type(obj).app_label:
+                return False
+        return perm in get_perms(user_obj, obj)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        return get_perms(user_obj, obj)
@@ -1,5 +1,29 @@
 import math
 
+import numpy as np
+
+
+def normalize_deltas(delta):
+    sum_deltas = sum(delta)
+
+    inc = -sum_deltas / len(delta) - 1
+
+    for i in range(len(delta)):
+        delta[i] += inc
+
+    top_group = int(max(min(float(len(delta)), 4 * math.sqrt(len(delta))), 1))
+
+    sum_top_deltas = sum(delta[:top_group])
+
+    inc = min(max(-sum_top_deltas / top_group, -80), 0)
+
+    for i in range(len(delta)):
+        delta[i] += inc
+
+    delta = [int(i - 1) for i in delta]
+
+    return delta
+
 
 class RatingSystem:
 
@@ -45,22 +69,135 @@ class RatingSystem:
 
             delta[i] = (R - self.ratings[i]) / 2
 
-        sum_deltas = sum(delta)
+        return normalize_deltas(delta)
+
+
+class VectorizedRatingSystem:
+    """
+    NumPy version of RatingSystem: seeds of all participants are computed in one batch
+    and satisfactions of all participants are bisected simultaneously.
+
+    Probabilities are accumulated in the same order as in RatingSystem, so the deltas
+    are identical. Participants whose bisection interval has already collapsed are not
+    evaluated again, so most of the 300 iterations cost nothing.
+    """
+
+    # Upper bound for the number of float64 cells in one probability block
+    block_size = 1 << 22
+
+    def __init__(self, ratings):
+        self.ratings = ratings
+        self.__ratings = np.asarray(ratings, dtype=np.float64)
+
+    def __get_seeds(self, values):
+        n = len(self.__ratings)
+        seeds = np.empty(len(values), dtype=np.float64)
+        rows = max(1, self.block_size // (n + 1))
+
+        for start in range(0, len(values), rows):
+            chunk = values[start:start + rows]
+            block = np.empty((len(chunk), n + 1), dtype=np.float64)
+            block[:, 0] = 1
+            np.subtract(chunk[:, None], self.__ratings[None, :], out=block[:, 1:])
+            block[:, 1:] /= 3000.0
+            np.power(10.0, block[:, 1:], out=block[:, 1:])
+            block[:, 1:] += 1.0
+            np.reciprocal(block[:, 1:], out=block[:, 1:])
+            np.cumsum(block, axis=1, out=block)
+            seeds[start:start + rows] = block[:, -1]
+
+        return seeds - 0.5
+
+    def __get_satisfactions(self, s):
+        left = np.zeros(len(s), dtype=np.float64)
+        right = np.full(len(s), 50000, dtype=np.float64)
+        for iteration in range(300):
+            mid = (left + right) / 2
+            active = np.flatnonzero((mid != left) & (mid != right))
+            if not len(active):
+                break
+            mid = mid[active]
+            less = self.__get_seeds(mid) < s[active]
+            right[active] = np.where(less, mid, right[active])
+            left[active] = np.where(less, left[active], mid)
+        return left
+
+    def calculate(self):
+        if len(self.ratings) == 0:
+            return []
+
+        places = np.arange(1, len(self.__ratings) + 1, dtype=np.float64)
+        m = np.sqrt(self.__get_seeds(self.__ratings) * places)
+        R = self.__get_satisfactions(m)
+
+        delta = ((R - self.__ratings) / 2).tolist()
 
-        inc = -sum_deltas / len(delta) - 1
+        return normalize_deltas(delta)
 
-        for i in range(len(delta)):
-            delta[i] += inc
 
-        top_group = int(max(min(float(len(delta)), 4 * math.sqrt(len(delta))), 1))
+class HistogramRatingSystem:
+    """
+    Approximate rating system for big contests.
+
+    Ratings are collapsed into buckets of bucket_width rating points (integer ratings with
+    bucket_width=1 collapse into distinct values without any loss), so each seed costs
+    O(distinct ratings). Satisfactions are not bisected: seed is tabulated once on a grid
+    with grid_step rating points over [0, 50000] and inverted with a binary search and
+    linear interpolation, which is O(log n) per participant.
+
+    Bucketing moves every rating by at most bucket_width / 2 points and the interpolation
+    error of the table is far below one rating point, so deltas differ from the exact
+    RatingSystem by at most 1 + bucket_width // 2 points.
+    """
+
+    block_size = 1 << 22
+
+    def __init__(self, ratings, bucket_width=1, grid_step=8):
+        self.ratings = ratings
+        self.bucket_width = bucket_width
+        self.grid_step = grid_step
 
-        sum_top_deltas = sum(delta[:top_group])
+        self.__ratings = np.asarray(ratings, dtype=np.float64)
+        buckets = np.round(self.__ratings / bucket_width) * bucket_width
+        self.__values, self.__inverse, self.__counts = np.unique(buckets, return_inverse=True, return_counts=True)
 
-        inc = min(max(-sum_top_deltas / top_group, -80), 0)
+    def __get_seeds(self, values):
+        seeds = np.empty(len(values), dtype=np.float64)
+        rows = max(1, self.block_size // len(self.__values))
+
+        for start in range(0, len(values), rows):
+            chunk = values[start:start + rows]
+            block = np.power(10.0, (chunk[:, None] - self.__values[None, :]) / 3000.0)
+            seeds[start:start + rows] = (self.__counts / (1.0 + block)).sum(axis=1)
+
+        return seeds + 0.5
+
+    def __get_satisfactions(self, s):
+        grid = np.arange(0, 50000 + self.grid_step, self.grid_step, dtype=np.float64)
+        grid[-1] = min(grid[-1], 50000)
+        table = self.__get_seeds(grid)
+
+        # table is decreasing, count grid points with seed not less than s
+        count = np.searchsorted(-table, -s, side='right')
+        inner = np.clip(count, 1, len(grid) - 1)
+
+        x0, x1 = grid[inner - 1], grid[inner]
+        y0, y1 = table[inner - 1], table[inner]
+        ret = x0 + (x1 - x0) * (y0 - s) / (y0 - y1)
+
+        ret[count == 0] = 0
+        ret[count == len(grid)] = 50000
+        return ret
+
+    def calculate(self):
+        if len(self.ratings) == 0:
+            return []
 
-        for i in range(len(delta)):
-            delta[i] += inc
+        places = np.arange(1, len(self.__ratings) + 1, dtype=np.float64)
+        seeds = self.__get_seeds(self.__values)[self.__inverse]
+        m = np.sqrt(seeds * places)
+        R = self.__get_satisfactions(m)
 
-        delta = [int(i - 1) for i in delta]
+        delta = ((R - self.__ratings) / 2).tolist()
 
-        return delta
+        return normalize_deltas(delta)
@@ -0,0 +1,288 @@
+import json
+import math
+import time
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django_redis import get_redis_connection
+
+# Score of a member is points * SCORE_BASE - seconds from contest start to the last solve,
+# so one ZSET orders users by points desc and then by last solve asc.
+SCORE_BASE = 10 ** 8
+
+
+def get_scoreboard_key(contest_id):
+    return 'scoreboard:{}'.format(contest_id)
+
+
+def get_usernames_key(contest_id):
+    return 'scoreboard:{}:usernames'.format(contest_id)
+
+
+def get_score(contest, points, last_solve):
+    if last_solve is None:
+        offset = SCORE_BASE - 1
+    else:
+        offset = min(max(int((last_solve - contest.start_time).total_seconds()), 0), SCORE_BASE - 1)
+    return points * SCORE_BASE - offset
+
+
+def get_points(score):
+    return int(math.ceil(score / SCORE_BASE))
+
+
+def rebuild_scoreboard(contest):
+    """
+    Replaces the contest scoreboard in Redis with ContestScore rows from the database.
+    """
+    rows = list(contest.scores.values_list('user_id', 'user__username', 'points', 'last_solve'))
+
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.delete(get_scoreboard_key(contest.id), get_usernames_key(contest.id))
+    if rows:
+        pipeline.zadd(get_scoreboard_key(contest.id), {
+            user_id: get_score(contest, points, last_solve) for user_id, _, points, last_solve in rows
+        })
+        pipeline.hmset(get_usernames_key(contest.id), {
+            user_id: username for user_id, username, _, _ in rows
+        })
+    pipeline.execute()
+
+
+def expire_scoreboard(contest_id, timeout):
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.expire(get_scoreboard_key(contest_id), timeout)
+    pipeline.expire(get_usernames_key(contest_id), timeout)
+    pipeline.execute()
+
+
+def update_scoreboard(contest, user, points, last_solve):
+    """
+    Sets the score of one user, does nothing if the scoreboard is not built.
+    """
+    connection = get_redis_connection('default')
+    if not connection.exists(get_scoreboard_key(contest.id)):
+        return
+
+    pipeline = connection.pipeline()
+    pipeline.zadd(get_scoreboard_key(contest.id), {user.id: get_score(contest, points, last_solve)})
+    pipeline.hset(get_usernames_key(contest.id), user.id, user.username)
+    pipeline.execute()
+
+
+def set_scores(contest, rows):
+    """
+    Writes absolute scores of users already on the scoreboard from (user_id, points, last_solve)
+    rows read from ContestScore, so concurrent solves cannot be counted twice.
+    """
+    if not rows:
+        return
+
+    get_redis_connection('default').zadd(get_scoreboard_key(contest.id), {
+        user_id: get_score(contest, points, last_solve) for user_id, points, last_solve in rows
+    }, xx=True)
+
+
+def remove_from_scoreboard(contest_id, user_ids):
+    if not user_ids:
+        return
+
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.zrem(get_scoreboard_key(contest_id), *user_ids)
+    pipeline.hdel(get_usernames_key(contest_id), *user_ids)
+    pipeline.execute()
+
+
+def get_channel_name(contest_id):
+    return 'scoreboard:{}:updates'.format(contest_id)
+
+
+def get_snapshot_key(contest_id):
+    return 'scoreboard_snapshot:{}'.format(contest_id)
+
+
+def get_scoreboard_page(contest_id, start, end=None):
+    """
+    Returns rows from start to end (exclusive, None for the last row) as dicts with user_id,
+    username and points, or None if the scoreboard is not built.
+    """
+    connection = get_redis_connection('default')
+    if not connection.exists(get_scoreboard_key(contest_id)):
+        return None
+
+    members = connection.zrevrange(get_scoreboard_key(contest_id), start, -1 if end is None else end - 1,
+                                   withscores=True)
+    if not members:
+        return []
+
+    usernames = connection.hmget(get_usernames_key(contest_id), [user_id for user_id, _ in members])
+    return [
+        {
+            'user_id': int(user_id),
+            'username': (username or b'').decode(),
+            'points': get_points(score)
+        }
+        for (user_id, score), username in zip(members, usernames)
+    ]
+
+
+def get_rank(contest_id, user_id):
+    """
+    Returns 1-based place of the user or None if the user is not on the scoreboard.
+    """
+    rank = get_redis_connection('default').zrevrank(get_scoreboard_key(contest_id), user_id)
+    if rank is None:
+        return None
+    return rank + 1
+
+
+def get_scoreboard_size(contest_id):
+    return get_redis_connection('default').zcard(get_scoreboard_key(contest_id))
+
+
+def get_scoreboard_rows(contest, start, end=None):
+    """
+    Same as get_scoreboard_page, but reads ContestScore rows if the scoreboard is not built.
+    """
+    rows = get_scoreboard_page(contest.id, start, end)
+    if rows is not None:
+        return rows
+
+    return list(contest.scores.order_by(
+        '-points',
+        'last_solve',
+        'user_id'
+    ).values(
+        'user_id',
+        'points',
+        username=F('user__username')
+    )[start:end])
+
+
+def set_snapshot(contest, rows):
+    snapshot = {
+        'rows': rows,
+        'places': {row['user_id']: place for place, row in enumerate(rows, 1)}
+    }
+    cache.set(get_snapshot_key(contest.id), snapshot, None)
+    return snapshot
+
+
+def freeze_snapshot(contest):
+    """
+    Stores the whole current scoreboard in cache, it is served until the contest ends.
+    """
+    return set_snapshot(contest, get_scoreboard_rows(contest, 0))
+
+
+def rebuild_snapshot(contest):
+    """
+    Rebuilds a lost snapshot from ContestScore rows not changed since the freeze. Points of users
+    who solved after the freeze are not known at the freeze time, they are left out instead of
+    showing the live standings.
+    """
+    return set_snapshot(contest, list(contest.scores.filter(
+        Q(last_solve__isnull=True) | Q(last_solve__lte=contest.freeze_time)
+    ).order_by(
+        '-points',
+        'last_solve',
+        'user_id'
+    ).values(
+        'user_id',
+        'points',
+        username=F('user__username')
+    )))
+
+
+def get_snapshot(contest):
+    return cache.get(get_snapshot_key(contest.id)) or rebuild_snapshot(contest)
+
+
+def delete_snapshot(contest_id):
+    cache.delete(get_snapshot_key(contest_id))
+
+
+def publish_event(contest_id, event, data):
+    get_redis_connection('default').publish(get_channel_name(contest_id), json.dumps({
+        'event': event,
+        'data': data
+    }))
+
+
+def publish_update(contest, user, points):
+    """
+    Sends the new score and place of the user to everyone subscribed to the contest.
+    """
+    publish_event(contest.id, 'update', {
+        'user_id': user.id,
+        'username': user.username,
+        'points': points,
+        'place': get_rank(contest.id, user.id)
+    })
+
+
+def get_stream_slots_key(contest_id, user_id):
+    return 'scoreboard_streams:{}:{}'.format(contest_id, user_id)
+
+
+def acquire_stream_slot(contest_id, user_id, limit, timeout):
+    """
+    Counts an open stream of the user, returns False if the user already has limit streams
+    of the contest. The counter expires after timeout seconds in case a worker dies.
+    """
+    key = get_stream_slots_key(contest_id, user_id)
+    connection = get_redis_connection('default')
+
+    pipeline = connection.pipeline()
+    pipeline.incr(key)
+    pipeline.expire(key, timeout)
+    streams, _ = pipeline.execute()
+    if streams > limit:
+        connection.decr(key)
+        return False
+    return True
+
+
+def release_stream_slot(contest_id, user_id):
+    get_redis_connection('default').decr(get_stream_slots_key(contest_id, user_id))
+
+
+def stream_slot_events(contest_id, user_id, keepalive):
+    """
+    Yields stream_events and releases the stream slot of the user when the stream ends
+    or the response is closed.
+    """
+    try:
+        yield from stream_events(contest_id, keepalive)
+    finally:
+        release_stream_slot(contest_id, user_id)
+
+
+def stream_events(contest_id, keepalive):
+    """
+    Yields server-sent events from the contest channel until the scoreboard freezes or
+    the contest ends, with a comment line every keepalive seconds of silence.
+    """
+    pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(get_channel_name(contest_id))
+
+    try:
+        yield 'retry: {}\n\n'.format(keepalive * 1000)
+        last_sent = time.time()
+        while True:
+            message = pubsub.get_message(timeout=keepalive)
+            if message is None:
+                # subscription confirmations are returned as None too
+                if time.time() - last_sent >= keepalive:
+                    yield ': keepalive\n\n'
+                    last_sent = time.time()
+                continue
+
+            payload = json.loads(message['data'])
+            yield 'event: {}\ndata: {}\n\n'.format(payload['event'], json.dumps(payload['data']))
+            last_sent = time.time()
+
+            if payload['event'] in ('freeze', 'end'):
+                return
+    finally:
+        pubsub.close()
@@ -0,0 +1,262 @@
+from django.db import transaction
+from django.db.models import F, Sum, Count
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
+from . import contest_access, page_cache, page_counts, permissions, scoreboard, submissions, task_tags
+from .context_processors import invalidate_sidebar_cache, UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY
+from .models import User, Post, Contest, ContestScore, ContestTaskRelationship, Task, TaskTag
+from .tasks import refresh_user_scores, refresh_task_solved_counts, rebuild_contest_scores, rebuild_contest_scoreboard
+
+
+@receiver(m2m_changed, sender=Contest.participants.through)
+def update_contest_scores(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        if reverse:
+            pairs = [(contest_id, instance.id) for contest_id in pk_set]
+        else:
+            pairs = [(instance.id, user_id) for user_id in pk_set]
+
+        existing = set(ContestScore.objects.filter(
+            contest_id__in=set(contest_id for contest_id, _ in pairs),
+            user_id__in=set(user_id for _, user_id in pairs)
+        ).values_list(
+            'contest_id',
+            'user_id'
+        ))
+
+        ContestScore.objects.bulk_create([
+            ContestScore(contest_id=contest_id, user_id=user_id)
+            for contest_id, user_id in pairs if (contest_id, user_id) not in existing
+        ])
+
+        if reverse:
+            scores = ContestScore.objects.filter(user=instance, contest_id__in=pk_set)
+        else:
+            scores = ContestScore.objects.filter(contest=instance, user_id__in=pk_set)
+        for score in scores.filter(contest__is_running=True).select_related('contest', 'user'):
+            scoreboard.update_scoreboard(score.contest, score.user, score.points, score.last_solve)
+
+    elif action == 'post_remove':
+        if reverse:
+            ContestScore.objects.filter(user=instance, contest_id__in=pk_set).delete()
+            for contest_id in pk_set:
+                scoreboard.remove_from_scoreboard(contest_id, [instance.id])
+        else:
+            ContestScore.objects.filter(contest=instance, user_id__in=pk_set).delete()
+            scoreboard.remove_from_scoreboard(instance.id, list(pk_set))
+
+    elif action == 'pre_clear':
+        if reverse:
+            contest_ids = list(ContestScore.objects.filter(user=instance).values_list('contest_id', flat=True))
+            ContestScore.objects.filter(user=instance).delete()
+            for contest_id in contest_ids:
+                scoreboard.remove_from_scoreboard(contest_id, [instance.id])
+        else:
+            user_ids = list(ContestScore.objects.filter(contest=instance).values_list('user_id', flat=True))
+            ContestScore.objects.filter(contest=instance).delete()
+            scoreboard.remove_from_scoreboard(instance.id, user_ids)
+
+
+@receiver(m2m_changed, sender=Task.solved_by.through)
+def update_user_scores(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_solvers = [instance.id]
+            instance._cleared_tasks = list(instance.solved_tasks.values_list('id', flat=True))
+        else:
+            instance._cleared_solvers = list(instance.solved_by.values_list('id', flat=True))
+            instance._cleared_tasks = [instance.id]
+
+    elif action == 'post_clear':
+        refresh_user_scores(User.objects.filter(id__in=getattr(instance, '_cleared_solvers', [])))
+        refresh_task_solved_counts(Task.objects.filter(id__in=getattr(instance, '_cleared_tasks', [])))
+        invalidate_solved_counts(getattr(instance, '_cleared_tasks', []), getattr(instance, '_cleared_solvers', []))
+
+    elif action in ('post_add', 'post_remove') and pk_set:
+        sign = 1 if action == 'post_add' else -1
+
+        if reverse:
+            invalidate_solved_counts(pk_set, [instance.id])
+            refresh_task_solved_counts(Task.objects.filter(id__in=pk_set))
+        else:
+            invalidate_solved_counts([instance.id], pk_set)
+            refresh_task_solved_counts(Task.objects.filter(id=instance.id))
+
+        if reverse:
+            published = Task.objects.filter(id__in=pk_set, is_published=True).aggregate(
+                cost=Sum('cost'),
+                count=Count('id')
+            )
+            if published['count']:
+                User.objects.filter(id=instance.id).update(
+                    score=F('score') + sign * published['cost'],
+                    solved_count=F('solved_count') + sign * published['count']
+                )
+        elif instance.is_published:
+            User.objects.filter(id__in=pk_set).update(
+                score=F('score') + sign * instance.cost,
+                solved_count=F('solved_count') + sign
+            )
+
+
+@receiver(m2m_changed, sender=ContestTaskRelationship.solved.through)
+def update_contest_task_solved_count(sender, instance, action, reverse, **kwargs):
+    # solves from the submit view bypass m2m_changed, this keeps the counter right for admin edits
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    cost = instance.cost
+    instance.solved_count = instance.solved.count()
+    instance.save()
+    # a changed cost already rebuilds the standings in post_save
+    if instance.cost == cost:
+        rebuild_standings_on_commit(instance)
+
+
+@receiver(pre_save, sender=ContestTaskRelationship)
+def remember_contest_task_cost(sender, instance, **kwargs):
+    instance._old_cost = ContestTaskRelationship.objects.filter(
+        id=instance.id
+    ).values_list(
+        'cost',
+        flat=True
+    ).first() if instance.id else None
+
+
+@receiver(post_save, sender=ContestTaskRelationship)
+def update_contest_task_scores(sender, instance, created, **kwargs):
+    # dynamic costs are recomputed by save, solve_contest_task changes them with update() instead
+    if not created and getattr(instance, '_old_cost', None) not in (None, instance.cost):
+        rebuild_standings_on_commit(instance)
+
+
+def rebuild_standings_on_commit(relationship):
+    def rebuild():
+        rebuild_contest_scores(relationship.contest)
+        rebuild_contest_scoreboard(relationship.contest_id)
+
+    transaction.on_commit(rebuild)
+
+
+def invalidate_solved_counts(task_ids, user_ids):
+    page_counts.invalidate_counts(
+        *[page_counts.TASK_SOLVED.format(task_id) for task_id in task_ids],
+        *[page_counts.USER_SOLVED_TASKS.format(user_id) for user_id in user_ids]
+    )
+    page_counts.forget_cursors(page_counts.USERS_TOP)
+    submissions.forget_solved_tasks(user_ids)
+
+
+@receiver(pre_delete, sender=Task)
+def remove_task_from_scores(sender, instance, **kwargs):
+    invalidate_solved_counts([instance.id], list(instance.solved_by.values_list('id', flat=True)))
+
+    if instance.is_published:
+        User.objects.filter(solved_tasks=instance).update(
+            score=F('score') - instance.cost,
+            solved_count=F('solved_count') - 1
+        )
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def forget_task_flag(sender, instance, **kwargs):
+    submissions.forget_flag(instance.id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_counts(sender, instance, **kwargs):
+    page_counts.invalidate_counts(page_counts.TASKS_ARCHIVE, page_counts.USER_TASKS.format(instance.author_id))
+
+
+@receiver(post_delete, sender=Task)
+def invalidate_task_pages(sender, instance, **kwargs):
+    if instance.is_published:
+        page_cache.bump_generation()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_counts(sender, instance, **kwargs):
+    page_counts.invalidate_counts(page_counts.MAIN_POSTS, page_counts.USER_BLOG.format(instance.author_id))
+    if instance.is_important:
+        page_cache.bump_generation()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_counts(sender, instance, created, update_fields, **kwargs):
+    # logins only update last_login, they don't change the tops
+    if created or update_fields is None or 'is_active' in update_fields:
+        page_counts.invalidate_user_list_counts()
+
+
+@receiver(pre_delete, sender=User)
+def remember_solved_tasks(sender, instance, **kwargs):
+    # solved_by rows are removed by the cascade without m2m_changed
+    instance._solved_task_ids = list(instance.solved_tasks.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def update_task_solved_counts(sender, instance, **kwargs):
+    refresh_task_solved_counts(Task.objects.filter(id__in=getattr(instance, '_solved_task_ids', [])))
+
+
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_tops_counts(sender, **kwargs):
+    page_counts.invalidate_user_list_counts()
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def invalidate_friends_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        page_counts.invalidate_counts(*[page_counts.FRIENDS.format(user_id) for user_id in pk_set or []])
+    else:
+        page_counts.invalidate_counts(page_counts.FRIENDS.format(instance.id))
+
+
+@receiver(post_save, sender=Contest)
+@receiver(post_delete, sender=Contest)
+def invalidate_contest_caches(sender, instance, **kwargs):
+    invalidate_sidebar_cache(UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY)
+    contest_access.forget_contest(instance.id)
+    page_counts.invalidate_counts(
+        page_counts.FINISHED_CONTESTS,
+        page_counts.USER_CONTESTS.format(instance.author_id),
+        page_counts.USER_FINISHED_CONTESTS.format(instance.author_id)
+    )
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def forget_user_permissions(sender, instance, **kwargs):
+    permissions.forget_permissions(instance.user_id, instance.content_type_id)
+
+
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def forget_group_permissions(sender, instance, **kwargs):
+    permissions.forget_all_permissions(content_type_id=instance.content_type_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_group_member_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        permissions.forget_all_permissions()
+    else:
+        permissions.forget_all_permissions(instance.id)
+
+
+@receiver(post_save, sender=TaskTag)
+@receiver(post_delete, sender=TaskTag)
+def forget_tag_ids(sender, **kwargs):
+    task_tags.forget_tag_ids()
@@ -0,0 +1,238 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q, Case, When, IntegerField, DateTimeField, Value as V, Subquery
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+
+from . import page_counts
+from .flags import get_prepared_matcher, prepare_flag
+from .models import User, Task, ContestTaskRelationship, ContestScore
+from .tasks import SUBMISSION_QUEUE_KEY, flush_submissions
+
+
+def get_flag_key(task_id):
+    return 'task_flag:{}'.format(task_id)
+
+
+def get_attempts_key(user_id, task_id):
+    return 'flag_attempts:{}:{}'.format(user_id, task_id)
+
+
+def get_flag(task_id):
+    """
+    Returns (flag_type, prepared flag) of the task or None if there is no such task.
+    Only digests are cached, except for flag types whose matchers need the flag itself.
+    """
+    flag = cache.get(get_flag_key(task_id))
+    if flag is None:
+        flag = Task.objects.filter(id=task_id).values_list('flag_type', 'flag').first()
+        if flag is None:
+            return None
+        flag = (flag[0], prepare_flag(*flag))
+        cache.set(get_flag_key(task_id), flag, settings.FLAG_CACHE_TIMEOUT)
+    return flag
+
+
+def forget_flag(task_id):
+    cache.delete(get_flag_key(task_id))
+
+
+def check_flag(task_id, user_id, flag):
+    """
+    Returns whether the flag is correct for the user or None if there is no such task.
+    """
+    task_flag = get_flag(task_id)
+    if task_flag is None:
+        return None
+    return get_prepared_matcher(*task_flag).match(flag, user_id)
+
+
+def is_throttled(user_id, task_id):
+    """
+    Counts the attempt and returns True if the user made more than FLAG_SUBMISSION_LIMIT
+    attempts for the task during the current FLAG_SUBMISSION_PERIOD seconds.
+    """
+    key = get_attempts_key(user_id, task_id)
+
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.set(key, 0, ex=settings.FLAG_SUBMISSION_PERIOD, nx=True)
+    pipeline.incr(key)
+    _, attempts = pipeline.execute()
+    return attempts > settings.FLAG_SUBMISSION_LIMIT
+
+
+def insert_solve(through, field_name, object_id, user_id):
+    """
+    Inserts a row into the m2m table unless it is already there, returns True if it was inserted.
+    m2m_changed is not sent, callers update dependent counters themselves.
+    """
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}, {}) VALUES (%s, %s) ON CONFLICT DO NOTHING'.format(
+                quote_name(through._meta.db_table),
+                quote_name(through._meta.get_field(field_name).column),
+                quote_name(through._meta.get_field('user').column)
+            ),
+            [object_id, user_id]
+        )
+        return cursor.rowcount == 1
+
+
+def solve_task(task_id, user, time):
+    """
+    Marks the task as solved by the user, updates last_solve and score in one UPDATE.
+    Returns False if the task was already solved.
+    """
+    published = Task.objects.filter(id=task_id, is_published=True)
+
+    with transaction.atomic():
+        if not insert_solve(Task.solved_by.through, 'task', task_id, user.id):
+            return False
+
+        Task.objects.filter(id=task_id).update(solved_count=F('solved_count') + 1)
+        User.objects.filter(id=user.id).update(
+            last_solve=time,
+            score=F('score') + Coalesce(Subquery(published.values('cost'), output_field=IntegerField()), V(0)),
+            solved_count=F('solved_count') + Coalesce(
+                Subquery(published.annotate(one=V(1, IntegerField())).values('one'), output_field=IntegerField()),
+                V(0)
+            )
+        )
+
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.sadd(get_solved_tasks_key(user.id), task_id)
+    pipeline.expire(get_solved_tasks_key(user.id), settings.SOLVED_TASKS_CACHE_TIMEOUT)
+    pipeline.execute()
+
+    page_counts.invalidate_counts(
+        page_counts.TASK_SOLVED.format(task_id),
+        page_counts.USER_SOLVED_TASKS.format(user.id)
+    )
+    page_counts.forget_user_top_cursors()
+    user.last_solve = time
+    return True
+
+
+def solve_contest_task(relationship, user, time):
+    """
+    Marks the contest task as solved by the user and adds its cost to the contest score.
+    For dynamic tasks the cost change is applied to every solver in the same UPDATE.
+    Returns the cost change (0 for static tasks) or None if the task was already solved in this contest.
+    """
+    relationships = ContestTaskRelationship.objects.filter(id=relationship.id)
+
+    with transaction.atomic():
+        through = ContestTaskRelationship.solved.through
+        if not insert_solve(through, 'contesttaskrelationship', relationship.id, user.id):
+            return None
+
+        relationships.update(solved_count=F('solved_count') + 1)
+        solved_count, old_cost = relationships.values_list('solved_count', 'cost').get()
+        new_cost = relationship.get_dynamic_cost(solved_count) if relationship.is_dynamic else old_cost
+
+        if new_cost == old_cost:
+            scores = ContestScore.objects.filter(contest_id=relationship.contest_id, user=user)
+        else:
+            relationships.update(cost=new_cost)
+            scores = ContestScore.objects.filter(
+                contest_id=relationship.contest_id,
+                user_id__in=ContestTaskRelationship.solved.through.objects.filter(
+                    contesttaskrelationship_id=relationship.id
+                ).values('user_id')
+            )
+
+        is_solver = Q(user_id=user.id)
+        scores.update(
+            points=F('points') + (new_cost - old_cost) + Case(
+                When(is_solver, then=V(old_cost)),
+                default=V(0),
+                output_field=IntegerField()
+            ),
+            solved_count=F('solved_count') + Case(
+                When(is_solver, then=V(1)),
+                default=V(0),
+                output_field=IntegerField()
+            ),
+            last_solve=Case(
+                When(is_solver, then=V(time)),
+                default=F('last_solve'),
+                output_field=DateTimeField()
+            )
+        )
+
+    relationship.cost = new_cost
+    return new_cost - old_cost
+
+
+def get_solved_tasks_key(user_id):
+    return 'solved_tasks:{}'.format(user_id)
+
+
+# Marks a loaded set, solve_task may add ids to a set that was not loaded yet
+SOLVED_TASKS_LOADED = 0
+
+
+def get_solved_task_ids(user, task_ids):
+    """
+    Returns ids of tasks from task_ids solved by the user, the set of solved tasks
+    is loaded into Redis on the first call and kept up to date by solve_task.
+    """
+    if not user.is_authenticated or not task_ids:
+        return set()
+
+    task_ids = list(task_ids)
+    key = get_solved_tasks_key(user.id)
+    redis = get_redis_connection('default')
+
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.sismember(key, SOLVED_TASKS_LOADED)
+    for task_id in task_ids:
+        pipeline.sismember(key, task_id)
+    loaded, *solved = pipeline.execute()
+
+    if not loaded:
+        solved_task_ids = set(Task.solved_by.through.objects.filter(
+            user_id=user.id
+        ).values_list(
+            'task_id',
+            flat=True
+        ))
+
+        pipeline = redis.pipeline()
+        pipeline.sadd(key, SOLVED_TASKS_LOADED, *solved_task_ids)
+        pipeline.expire(key, settings.SOLVED_TASKS_CACHE_TIMEOUT)
+        pipeline.execute()
+        return solved_task_ids.intersection(task_ids)
+
+    return {task_id for task_id, is_solved in zip(task_ids, solved) if is_solved}
+
+
+def is_solved(user, task_id):
+    return task_id in get_solved_task_ids(user, [task_id])
+
+
+def forget_solved_tasks(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        get_redis_connection('default').delete(*[get_solved_tasks_key(user_id) for user_id in user_ids])
+
+
+def log_submission(user_id, task_id, contest_id, correct, time, ip):
+    """
+    Buffers the submission in Redis, flush_submissions is queued every
+    SUBMISSION_FLUSH_BATCH_SIZE submissions and also runs periodically.
+    """
+    length = get_redis_connection('default').rpush(SUBMISSION_QUEUE_KEY, json.dumps({
+        'user_id': user_id,
+        'task_id': task_id,
+        'contest_id': contest_id,
+        'correct': correct,
+        'timestamp': time.timestamp(),
+        'ip': ip
+    }))
+    if length % settings.SUBMISSION_FLUSH_BATCH_SIZE == 0:
+        flush_submissions.delay()
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Task, TaskTag
+
+TAG_IDS_CACHE_KEY = 'task_tags:ids'
+
+
+def get_tag_ids():
+    """
+    Returns {name: id} of all tags, cached until a tag is created, changed or deleted.
+    """
+    return cache.get_or_set(
+        TAG_IDS_CACHE_KEY,
+        lambda: dict(TaskTag.objects.values_list('name', 'id')),
+        settings.TAG_IDS_CACHE_TIMEOUT
+    )
+
+
+def forget_tag_ids():
+    cache.delete(TAG_IDS_CACHE_KEY)
+
+
+def search(prefix, limit):
+    return sorted(name for name in get_tag_ids() if name.startswith(prefix))[:limit]
+
+
+def get_or_create_tags(names):
+    """
+    Returns ids of tags with the given names, the missing ones are inserted with one statement.
+    Creating tags this way does not send post_save, the cached map is dropped here.
+    """
+    tag_ids = get_tag_ids()
+    missing = list(dict.fromkeys(name for name in names if name not in tag_ids))
+
+    if missing:
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            # DO UPDATE instead of DO NOTHING, so tags created concurrently are returned too
+            cursor.execute(
+                'INSERT INTO {table} ({name}) VALUES {values} '
+                'ON CONFLICT ({name}) DO UPDATE SET {name} = EXCLUDED.{name} RETURNING {name}, {id}'.format(
+                    table=quote_name(TaskTag._meta.db_table),
+                    name=quote_name(TaskTag._meta.get_field('name').column),
+                    id=quote_name(TaskTag._meta.pk.column),
+                    values=', '.join(['(%s)'] * len(missing))
+                ),
+                missing
+            )
+            tag_ids = {**tag_ids, **dict(cursor.fetchall())}
+        forget_tag_ids()
+
+    return [tag_ids[name] for name in names]
+
+
+def set_task_tags(task, names):
+    """
+    Makes names the tags of the task, only through rows of added and removed tags are written.
+    m2m_changed is not sent.
+    """
+    tag_ids = set(get_or_create_tags(names))
+    through = Task.tags.through
+    current_tag_ids = set(through.objects.filter(task_id=task.id).values_list('tasktag_id', flat=True))
+
+    removed = current_tag_ids - tag_ids
+    if removed:
+        through.objects.filter(task_id=task.id, tasktag_id__in=removed).delete()
+
+    through.objects.bulk_create([through(task_id=task.id, tasktag_id=tag_id) for tag_id in tag_ids - current_tag_ids])
@@ -1,13 +1,29 @@
+import json
+from datetime import datetime
+
 from celery import shared_task
 from django.apps import apps
-from django.db.models import Sum, Case, When, IntegerField, Value as V
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Count, Case, When, IntegerField, F, Q, Value as V, Subquery, OuterRef
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
 from stdimage.utils import render_variations
 
-from .rating_system import RatingSystem
+from . import page_cache, page_counts, scoreboard
+from .context_processors import invalidate_sidebar_cache
+from .context_processors import TOP_USERS_CACHE_KEY, UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY
 
 get_model = apps.get_model
 
+RATING_UPDATE_BATCH_SIZE = 1000
+
+SUBMISSION_QUEUE_KEY = 'submissions:queue'
+SUBMISSION_FLUSH_LOCK_KEY = 'submissions:flush_lock'
+
 
 @shared_task
 def process_stdimage(file_name, variations, storage):
@@ -28,6 +44,10 @@ def start_contest(contest_id):
     contest.is_running = True
     contest.save()
 
+    invalidate_sidebar_cache(UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY)
+    page_cache.bump_generation()
+    rebuild_contest_scoreboard.delay(contest_id)
+
 
 @shared_task(bind=True)
 def end_contest(self, contest_id):
@@ -49,8 +69,46 @@ def end_contest(self, contest_id):
     contest.is_registration_open = False
     contest.save()
 
+    scoreboard.delete_snapshot(contest_id)
+    scoreboard.publish_event(contest_id, 'end', {})
+    invalidate_sidebar_cache(RUNNING_CONTESTS_CACHE_KEY)
+    page_cache.bump_generation()
+
     recalculate_rating.delay(contest_id)
     publish_tasks.delay(contest_id)
+    rebuild_contest_scoreboard.delay(contest_id)
+
+
+@shared_task(bind=True)
+def freeze_scoreboard(self, contest_id):
+    print('Freezing scoreboard for contest {}'.format(contest_id))
+    contest = get_model('website', 'Contest').objects.filter(
+        id=contest_id,
+        celery_freeze_task_id=self.request.id,
+    ).first()
+    if not contest:
+        print('Scoreboard not freezing, no such contest')
+        return
+
+    if not contest.is_running:
+        print('Contest is not running')
+        return
+
+    scoreboard.freeze_snapshot(contest)
+    scoreboard.publish_event(contest_id, 'freeze', {})
+
+
+@shared_task
+def rebuild_contest_scoreboard(contest_id):
+    print('Rebuilding scoreboard for contest', contest_id)
+    contest = get_model('website', 'Contest').objects.filter(id=contest_id).first()
+    if not contest:
+        print('No such contest')
+        return
+
+    scoreboard.rebuild_scoreboard(contest)
+    if contest.is_finished:
+        scoreboard.expire_scoreboard(contest.id, settings.FINISHED_SCOREBOARD_TTL)
 
 
 @shared_task
@@ -61,6 +119,47 @@ def recalculate_rating(contest_id):
         print('No such contest')
         return
 
+    standings = get_contest_standings(contest)
+    ratings = dict(get_model('website', 'User').objects.filter(id__in=standings).values_list('id', 'rating'))
+    # on a rerun the ratings already include this contest, start from the stored ones before it
+    ratings.update(get_model('website', 'RatingChange').objects.filter(
+        contest=contest,
+        user_id__in=standings
+    ).values_list(
+        'user_id',
+        'old_rating'
+    ))
+    changes = calculate_rating_changes(contest, standings, ratings)
+
+    with transaction.atomic():
+        save_rating_changes(contest, changes)
+        update_ratings([(change.user_id, change.new_rating) for change in changes])
+
+    invalidate_sidebar_cache(TOP_USERS_CACHE_KEY)
+    page_counts.forget_rating_top_cursors()
+    page_cache.bump_generation()
+
+
+def get_contest_standings(contest):
+    return list(get_model('website', 'ContestScore').objects.filter(
+        contest=contest
+    ).order_by(
+        '-points',
+        'last_solve',
+        'user_id'
+    ).values_list(
+        'user_id',
+        flat=True
+    ))
+
+
+def rebuild_contest_scores(contest):
+    """
+    Recomputes ContestScore rows of the contest from solved relationships. Solve times
+    are not stored, so rows without last_solve get the user's last solve time.
+    """
+    score_model = get_model('website', 'ContestScore')
+
     participants = contest.participants.annotate(
         cost_sum=Sum(
             Case(
@@ -71,25 +170,100 @@ def recalculate_rating(contest_id):
                 default=V(0),
                 output_field=IntegerField()
             )
+        ),
+        contest_solved_count=Count(
+            'contest_task_relationship',
+            filter=Q(contest_task_relationship__contest=contest)
         )
-    ).order_by(
-        '-cost_sum',
-        'last_solve',
     ).values_list(
         'id',
         'cost_sum',
-        'rating',
-        'max_rating'
+        'contest_solved_count',
+        'last_solve'
     )
 
-    ratings = [player[2] for player in participants]
-    rs = RatingSystem(ratings)
-    deltas = rs.calculate()
+    with transaction.atomic():
+        last_solves = dict(score_model.objects.filter(
+            contest=contest,
+            last_solve__isnull=False
+        ).values_list(
+            'user_id',
+            'last_solve'
+        ))
+
+        score_model.objects.filter(contest=contest).delete()
+        score_model.objects.bulk_create([
+            score_model(
+                contest=contest,
+                user_id=user_id,
+                points=points or 0,
+                solved_count=solved_count,
+                last_solve=last_solves.get(user_id, last_solve) if solved_count else None
+            )
+            for user_id, points, solved_count, last_solve in participants
+        ], batch_size=RATING_UPDATE_BATCH_SIZE)
+
+
+def calculate_rating_changes(contest, standings, ratings):
+    """
+    Returns unsaved RatingChange objects for users listed in standings (ordered by place),
+    ratings maps user id to the rating before the contest.
+    """
+    old_ratings = [ratings[user_id] for user_id in standings]
+    deltas = import_string(settings.RATING_SYSTEM)(old_ratings).calculate()
+
+    rating_change_model = get_model('website', 'RatingChange')
+    return [
+        rating_change_model(
+            contest=contest,
+            user_id=user_id,
+            place=place + 1,
+            old_rating=old_ratings[place],
+            new_rating=old_ratings[place] + deltas[place],
+            delta=deltas[place]
+        )
+        for place, user_id in enumerate(standings)
+    ]
+
+
+def save_rating_changes(contest, changes):
+    rating_change_model = get_model('website', 'RatingChange')
+    rating_change_model.objects.filter(contest=contest).delete()
+    rating_change_model.objects.bulk_create(changes, batch_size=RATING_UPDATE_BATCH_SIZE)
+
+
+def update_integer_field(model, field, values):
+    """
+    Sets integer field to value for every (object_id, value) pair, one CASE update per batch.
+    """
+    for start in range(0, len(values), RATING_UPDATE_BATCH_SIZE):
+        batch = values[start:start + RATING_UPDATE_BATCH_SIZE]
+        model.objects.filter(
+            id__in=[object_id for object_id, _ in batch]
+        ).update(**{
+            field: Case(
+                *[When(id=object_id, then=V(value)) for object_id, value in batch],
+                output_field=IntegerField()
+            )
+        })
+
+
+def update_ratings(new_ratings):
+    """
+    Writes (user_id, rating) pairs with one CASE update per batch and raises max_rating
+    with a single statement, all in one transaction.
+    """
+    user_model = get_model('website', 'User')
 
-    for i, player in enumerate(participants):
-        get_model('website', 'User').objects.filter(id=player[0]).update(rating=player[2] + deltas[i])
-        if player[2] + deltas[i] > player[3]:
-            get_model('website', 'User').objects.filter(id=player[0]).update(max_rating=player[2] + deltas[i])
+    with transaction.atomic():
+        update_integer_field(user_model, 'rating', new_ratings)
+
+        user_model.objects.filter(
+            id__in=[user_id for user_id, _ in new_ratings],
+            rating__gt=F('max_rating')
+        ).update(
+            max_rating=F('rating')
+        )
 
 
 @shared_task
@@ -100,4 +274,118 @@ def publish_tasks(contest_id):
         print('No such contest')
         return
 
-    contest.tasks.update(is_published=True, publication_time=timezone.now())
+    task_ids = list(contest.tasks.filter(is_published=False).values_list('id', flat=True))
+    get_model('website', 'Task').objects.filter(id__in=task_ids).update(
+        is_published=True,
+        publication_time=timezone.now()
+    )
+    refresh_user_scores(get_task_solvers(task_ids))
+    page_counts.invalidate_counts(page_counts.TASKS_ARCHIVE)
+    page_cache.bump_generation()
+
+
+def get_task_solvers(task_ids):
+    solved = get_model('website', 'Task').solved_by.through.objects.filter(task_id__in=task_ids)
+    return get_model('website', 'User').objects.filter(id__in=solved.values('user_id'))
+
+
+def refresh_user_scores(users):
+    """
+    Recomputes stored score and solved_count of users from published solved tasks
+    with a single UPDATE.
+    """
+    solved = get_model('website', 'Task').solved_by.through.objects.filter(
+        user_id=OuterRef('id'),
+        task__is_published=True
+    ).order_by().values('user_id')
+
+    users.update(
+        score=Coalesce(
+            Subquery(solved.annotate(total=Sum('task__cost')).values('total'), output_field=IntegerField()),
+            V(0)
+        ),
+        solved_count=Coalesce(
+            Subquery(solved.annotate(total=Count('task_id')).values('total'), output_field=IntegerField()),
+            V(0)
+        )
+    )
+    page_counts.forget_cursors(page_counts.USERS_TOP)
+
+
+def refresh_task_solved_counts(tasks):
+    """
+    Recomputes stored solved_count of tasks from the solved_by table with a single UPDATE.
+    """
+    solved = get_model('website', 'Task').solved_by.through.objects.filter(
+        task_id=OuterRef('id')
+    ).order_by().values('task_id')
+
+    tasks.update(
+        solved_count=Coalesce(
+            Subquery(solved.annotate(total=Count('user_id')).values('total'), output_field=IntegerField()),
+            V(0)
+        )
+    )
+
+
+@shared_task
+def flush_submissions():
+    """
+    Moves submissions buffered by website.submissions.log_submission from Redis to the database.
+    A batch is removed from the queue only after it is saved, the lock keeps concurrent
+    flushes from saving the same batch twice. The lock holds a token of this flush and is
+    renewed before every batch, a flush that lost it stops and never releases another one.
+    """
+    connection = get_redis_connection('default')
+    batch_size = settings.SUBMISSION_FLUSH_BATCH_SIZE
+
+    lock = connection.lock(SUBMISSION_FLUSH_LOCK_KEY, timeout=settings.SUBMISSION_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return
+
+    try:
+        while True:
+            items = connection.lrange(SUBMISSION_QUEUE_KEY, 0, batch_size - 1)
+            if not items:
+                return
+
+            lock.reacquire()
+            save_submissions([json.loads(item) for item in items])
+            connection.ltrim(SUBMISSION_QUEUE_KEY, len(items), -1)
+            if len(items) < batch_size:
+                return
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            print('Submission flush lock expired')
+
+
+def save_submissions(items):
+    """
+    Creates Submission rows, skipping the ones whose user, task or contest has been deleted meanwhile.
+    """
+    user_ids = set(get_model('website', 'User').objects.filter(
+        id__in=set(item['user_id'] for item in items)
+    ).values_list('id', flat=True))
+    task_ids = set(get_model('website', 'Task').objects.filter(
+        id__in=set(item['task_id'] for item in items)
+    ).values_list('id', flat=True))
+    contest_ids = set(get_model('website', 'Contest').objects.filter(
+        id__in=set(item['contest_id'] for item in items if item['contest_id'] is not None)
+    ).values_list('id', flat=True))
+
+    Submission = get_model('website', 'Submission')
+    Submission.objects.bulk_create([
+        Submission(
+            user_id=item['user_id'],
+            task_id=item['task_id'],
+            contest_id=item['contest_id'],
+            correct=item['correct'],
+            timestamp=datetime.fromtimestamp(item['timestamp'], tz=timezone.utc),
+            ip=item['ip']
+        )
+        for item in items
+        if item['user_id'] in user_ids and item['task_id'] in task_ids and
+        (item['contest_id'] is None or item['contest_id'] in contest_ids)
+    ])
@@ -1,5 +1,7 @@
 from django import template
 
+from website import permissions, submissions
+
 register = template.Library()
 
 
@@ -13,5 +15,15 @@ def is_friends_with(user, other_user):
     return not user.is_anonymous and not other_user.is_anonymous and user.friends.filter(id=other_user.id).exists()
 
 
+@register.filter
+def is_solved_by(task, user):
+    return submissions.is_solved(user, task.id)
+
+
+@register.simple_tag
+def get_object_perms(user, obj):
+    return permissions.get_perms(user, obj)
+
+
 def is_in_m2m(obj, obj_set):
     return obj_set.filter(id=obj.id).exists()
@@ -1,8 +1,31 @@
+import json
+import random
+from unittest import mock
+
 from django.contrib.auth import get_user
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command, CommandError
+from django.db import connection, DatabaseError
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import assign_perm, remove_perm
 
-from .models import User
+from .flags import get_matcher, get_dynamic_flag
+from .models import User, Contest, Task, TaskTag, ContestTaskRelationship, ContestScore, RatingChange, Submission
+from . import contest_access, page_cache, page_counts, permissions, scoreboard, submissions, task_tags
+from .context_processors import invalidate_sidebar_cache, top_users, running_contests
+from .context_processors import TOP_USERS_CACHE_KEY, UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY
+from .rating_system import RatingSystem, VectorizedRatingSystem, HistogramRatingSystem
+from .tasks import recalculate_rating, rebuild_contest_scores, flush_submissions
+from .tasks import SUBMISSION_QUEUE_KEY, SUBMISSION_FLUSH_LOCK_KEY
+from .views.view_classes import get_cursor_key
 
 
 # Create your tests here.
@@ -31,3 +54,921 @@ class UserLoginTestCase(TestCase):
         response = self.client.get(reverse('logout'))
         user = get_user(self.client)
         assert not user.is_authenticated
+
+
+class RatingSystemTestCase(SimpleTestCase):
+    def test_vectorized_matches_reference(self):
+        rnd = random.Random(1337)
+        for _ in range(20):
+            ratings = [rnd.randint(500, 4000) for _ in range(rnd.randint(1, 40))]
+            assert VectorizedRatingSystem(ratings).calculate() == RatingSystem(ratings).calculate()
+
+    @staticmethod
+    def assert_histogram_error_is_bounded(ratings):
+        exact = VectorizedRatingSystem(ratings).calculate()
+        for bucket_width in (1, 5, 10, 25, 50):
+            approximate = HistogramRatingSystem(ratings, bucket_width=bucket_width).calculate()
+            assert max(abs(a - b) for a, b in zip(exact, approximate)) <= 1 + bucket_width // 2
+
+    def test_histogram_error_is_bounded(self):
+        rnd = random.Random(1337)
+        for n in (200, 1000):
+            self.assert_histogram_error_is_bounded([rnd.randint(500, 4000) for _ in range(n)])
+
+    def test_histogram_error_is_bounded_for_default_ratings(self):
+        # most participants of big contests have never been rated and keep the default 2000
+        rnd = random.Random(1337)
+        for n in (200, 1000):
+            self.assert_histogram_error_is_bounded([
+                2000 if rnd.random() < 0.7 else int(rnd.gauss(2000, 60)) for _ in range(n)
+            ])
+        self.assert_histogram_error_is_bounded([2000] * 500)
+
+    def test_empty_contest(self):
+        assert VectorizedRatingSystem([]).calculate() == []
+        assert HistogramRatingSystem([]).calculate() == []
+
+
+class RatingRecalculationTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username='user{}'.format(i), email='{}@email.com'.format(i))
+                      for i in range(4)]
+        now = timezone.now()
+        Contest.objects.bulk_create([
+            Contest(title='first', is_finished=True, end_time=now - timezone.timedelta(days=2)),
+            Contest(title='second', is_finished=True, end_time=now - timezone.timedelta(days=1)),
+        ])
+        self.first, self.second = Contest.objects.order_by('end_time')
+        task = Task.objects.create(name='task', flag='flag')
+
+        for contest in (self.first, self.second):
+            contest.participants.add(*self.users)
+            relationship = ContestTaskRelationship.objects.create(contest=contest, task=task, cost=100)
+            relationship.solved.add(self.users[0] if contest == self.first else self.users[3])
+            rebuild_contest_scores(contest)
+
+    def get_ratings(self, field='rating'):
+        return list(User.objects.filter(
+            id__in=[u.id for u in self.users]
+        ).order_by(
+            'id'
+        ).values_list(
+            field,
+            flat=True
+        ))
+
+    def test_rating_changes_are_stored(self):
+        recalculate_rating(self.first.id)
+
+        changes = RatingChange.objects.filter(contest=self.first)
+        assert changes.count() == len(self.users)
+        assert changes.get(place=1).user_id == self.users[0].id
+        for change in changes:
+            user = User.objects.get(id=change.user_id)
+            assert user.rating == change.new_rating == change.old_rating + change.delta
+            assert user.max_rating == max(change.old_rating, change.new_rating)
+
+    def test_rerun_does_not_apply_changes_twice(self):
+        recalculate_rating(self.first.id)
+        ratings = self.get_ratings()
+        changes = list(RatingChange.objects.filter(contest=self.first).values_list('user_id', 'delta'))
+
+        recalculate_rating(self.first.id)
+        assert self.get_ratings() == ratings
+        assert list(RatingChange.objects.filter(contest=self.first).values_list('user_id', 'delta')) == changes
+
+    def test_recalculation_from_contest_replays_history(self):
+        recalculate_rating(self.first.id)
+        recalculate_rating(self.second.id)
+        expected = self.get_ratings()
+
+        User.objects.update(rating=0)
+        call_command('recalculate_ratings', self.first.id)
+        assert self.get_ratings() == expected
+
+        call_command('recalculate_ratings', self.second.id)
+        assert self.get_ratings() == expected
+
+    def test_recalculation_rebuilds_max_rating(self):
+        recalculate_rating(self.first.id)
+        recalculate_rating(self.second.id)
+        expected = self.get_ratings('max_rating')
+
+        # peaks of replayed contests are recomputed, so an inflated max rating comes back down
+        User.objects.update(max_rating=2800)
+        call_command('recalculate_ratings', self.first.id)
+        assert self.get_ratings('max_rating') == expected
+
+    def test_contest_without_history_is_refused(self):
+        recalculate_rating(self.first.id)
+        ratings = self.get_ratings()
+
+        with self.assertRaises(CommandError):
+            call_command('recalculate_ratings', self.first.id)
+        assert self.get_ratings() == ratings
+
+
+class ContestScoreTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.user.set_password('test_password')
+        self.user.save()
+        self.client.force_login(self.user)
+
+        Contest.objects.bulk_create([Contest(title='contest', is_published=True, is_running=True)])
+        self.contest = Contest.objects.get()
+        contest_access.forget_contest(self.contest.id)
+        permissions.forget_all_permissions(self.user.id)
+        self.task = Task.objects.create(name='task', flag='flag')
+        ContestTaskRelationship.objects.create(contest=self.contest, task=self.task, cost=300)
+        get_redis_connection('default').delete(
+            submissions.get_attempts_key(self.user.id, self.task.id),
+            scoreboard.get_scoreboard_key(self.contest.id),
+            scoreboard.get_usernames_key(self.contest.id)
+        )
+
+    def submit(self, flag):
+        return self.client.post(reverse('contest_task_submit', kwargs={
+            'contest_id': self.contest.id,
+            'task_id': self.task.id
+        }), {'flag': flag})
+
+    def test_score_row_follows_participants(self):
+        self.contest.participants.add(self.user)
+        assert ContestScore.objects.filter(contest=self.contest, user=self.user).exists()
+
+        self.contest.participants.remove(self.user)
+        assert not ContestScore.objects.filter(contest=self.contest, user=self.user).exists()
+
+    def test_main_page_shows_tasks(self):
+        self.contest.participants.add(self.user)
+        self.submit('flag')
+        url = reverse('contest_view', kwargs={'contest_id': self.contest.id})
+
+        response = self.client.get(url)
+        assert response.status_code == 200
+        task = response.context['tasks'].get()
+        assert (task.contest_cost, task.contest_solved_count, task.is_solved_by_user) == (300, 1, True)
+
+        self.client.logout()
+        assert self.client.get(url).status_code == 200
+
+    def test_solve_updates_score_once(self):
+        self.contest.participants.add(self.user)
+        self.submit('wrong')
+        self.submit('flag')
+        self.submit('flag')
+
+        score = ContestScore.objects.get(contest=self.contest, user=self.user)
+        assert score.points == 300
+        assert score.solved_count == 1
+        assert score.last_solve is not None
+
+    def test_redis_scoreboard(self):
+        other = User.objects.create(username='other', email='other@email.com')
+        self.contest.participants.add(self.user, other)
+        scoreboard.rebuild_scoreboard(self.contest)
+        assert scoreboard.get_scoreboard_size(self.contest.id) == 2
+
+        self.submit('flag')
+        page = scoreboard.get_scoreboard_page(self.contest.id, 0, 10)
+        assert [row['username'] for row in page] == ['test', 'other']
+        assert [row['points'] for row in page] == [300, 0]
+        assert scoreboard.get_rank(self.contest.id, self.user.id) == 1
+        assert scoreboard.get_rank(self.contest.id, other.id) == 2
+
+        self.contest.participants.remove(other)
+        assert scoreboard.get_rank(self.contest.id, other.id) is None
+
+    def test_rebuild_command_repairs_drift(self):
+        self.contest.participants.add(self.user)
+        self.submit('flag')
+        ContestScore.objects.filter(contest=self.contest).update(points=5, solved_count=0)
+        scoreboard.rebuild_scoreboard(self.contest)
+
+        call_command('rebuild_contest_scores', self.contest.id)
+        score = ContestScore.objects.get(contest=self.contest, user=self.user)
+        assert (score.points, score.solved_count) == (300, 1)
+        assert [row['points'] for row in scoreboard.get_scoreboard_page(self.contest.id, 0, 10)] == [300]
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_contest_scores', 0)
+
+    def test_frozen_snapshot_is_not_updated(self):
+        Contest.objects.filter(id=self.contest.id).update(
+            end_time=timezone.now() + timezone.timedelta(hours=1),
+            scoreboard_freeze=timezone.timedelta(hours=2)
+        )
+        self.contest.refresh_from_db()
+        assert self.contest.is_scoreboard_frozen
+
+        self.contest.participants.add(self.user)
+        scoreboard.delete_snapshot(self.contest.id)
+        scoreboard.freeze_snapshot(self.contest)
+        self.submit('flag')
+
+        snapshot = scoreboard.get_snapshot(self.contest)
+        assert [row['points'] for row in snapshot['rows']] == [0]
+        assert snapshot['places'] == {self.user.id: 1}
+
+        # a lost snapshot does not show solves made after the freeze
+        other = User.objects.create(username='other', email='other@email.com')
+        self.contest.participants.add(other)
+        scoreboard.delete_snapshot(self.contest.id)
+        snapshot = scoreboard.get_snapshot(self.contest)
+        assert [row['username'] for row in snapshot['rows']] == ['other']
+
+    def test_dynamic_cost(self):
+        relationship = ContestTaskRelationship.objects.get()
+        relationship.is_dynamic = True
+        relationship.initial_cost = 500
+        relationship.min_cost = 100
+        relationship.decay = 2
+        relationship.save()
+        assert relationship.cost == 500
+        assert [relationship.get_dynamic_cost(count) for count in range(1, 5)] == [500, 400, 100, 100]
+
+        other = User.objects.create(username='other', email='other@email.com')
+        self.contest.participants.add(self.user, other)
+        scoreboard.rebuild_scoreboard(self.contest)
+
+        assert submissions.solve_contest_task(relationship, other, timezone.now()) == 0
+        scoreboard.rebuild_scoreboard(self.contest)
+        self.submit('flag')
+
+        relationship.refresh_from_db()
+        assert (relationship.solved_count, relationship.cost) == (2, 400)
+        assert dict(ContestScore.objects.values_list('user__username', 'points')) == {'test': 400, 'other': 400}
+        assert [row['points'] for row in scoreboard.get_scoreboard_page(self.contest.id, 0)] == [400, 400]
+        assert scoreboard.get_rank(self.contest.id, other.id) == 1
+
+    def test_dynamic_cost_writes_absolute_scores(self):
+        ContestTaskRelationship.objects.update(is_dynamic=True, initial_cost=500, min_cost=100, decay=2, cost=500)
+        relationship = ContestTaskRelationship.objects.get()
+        other = User.objects.create(username='other', email='other@email.com')
+        self.contest.participants.add(self.user, other)
+        submissions.solve_contest_task(relationship, other, timezone.now())
+        scoreboard.rebuild_scoreboard(self.contest)
+
+        # as if a concurrent solve had already lowered the score of other
+        get_redis_connection('default').zadd(scoreboard.get_scoreboard_key(self.contest.id), {other.id: 0})
+        self.submit('flag')
+        assert [row['points'] for row in scoreboard.get_scoreboard_page(self.contest.id, 0)] == [400, 400]
+
+    @mock.patch('website.signals.transaction.on_commit', side_effect=lambda rebuild: rebuild())
+    def test_cost_edits_update_scores(self, on_commit):
+        other = User.objects.create(username='other', email='other@email.com')
+        self.contest.participants.add(self.user, other)
+        scoreboard.rebuild_scoreboard(self.contest)
+        self.submit('flag')
+
+        relationship = ContestTaskRelationship.objects.get()
+        relationship.cost = 200
+        relationship.save()
+        assert dict(ContestScore.objects.values_list('user__username', 'points')) == {'test': 200, 'other': 0}
+
+        relationship.is_dynamic = True
+        relationship.initial_cost = 500
+        relationship.min_cost = 100
+        relationship.decay = 2
+        relationship.save()
+        assert ContestScore.objects.get(user=self.user).points == 500
+
+        # an admin adds a solver, the cost decays for both
+        relationship.solved.add(other)
+        assert dict(ContestScore.objects.values_list('user__username', 'points')) == {'test': 400, 'other': 400}
+        assert [row['points'] for row in scoreboard.get_scoreboard_page(self.contest.id, 0)] == [400, 400]
+
+    def test_scoreboard_stream(self):
+        self.contest.participants.add(self.user)
+        scoreboard.rebuild_scoreboard(self.contest)
+
+        events = scoreboard.stream_events(self.contest.id, 1)
+        assert next(events).startswith('retry:')
+
+        self.submit('flag')
+        assert next(events) == 'event: update\ndata: {}\n\n'.format(json.dumps({
+            'user_id': self.user.id,
+            'username': 'test',
+            'points': 300,
+            'place': 1
+        }))
+
+        scoreboard.publish_event(self.contest.id, 'end', {})
+        assert next(events).startswith('event: end')
+        assert next(events, None) is None
+
+
+class ScoreboardUpdatesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@email.com')
+        Contest.objects.bulk_create([Contest(title='contest', is_published=True, is_running=True)])
+        self.contest = Contest.objects.get()
+        contest_access.forget_contest(self.contest.id)
+        permissions.forget_all_permissions(self.user.id)
+        get_redis_connection('default').delete(scoreboard.get_stream_slots_key(self.contest.id, self.user.id))
+        self.stream_url = reverse('contest_scoreboard_stream', args=(self.contest.id,))
+
+    def test_stream_is_disabled_by_default(self):
+        self.client.force_login(self.user)
+        assert self.client.get(self.stream_url).status_code == 404
+
+    @override_settings(SCOREBOARD_STREAM_ENABLED=True, SCOREBOARD_STREAMS_PER_USER=1)
+    def test_stream_needs_participation_and_is_capped(self):
+        assert self.client.get(self.stream_url).status_code == 302
+
+        self.client.force_login(self.user)
+        assert self.client.get(self.stream_url).status_code == 403
+
+        assign_perm('can_participate_in_contest', self.user, self.contest)
+        first = self.client.get(self.stream_url)
+        assert first.status_code == 200
+        assert self.client.get(self.stream_url).status_code == 429
+
+        assert next(first.streaming_content).startswith(b'retry:')
+        first.close()
+        assert self.client.get(self.stream_url).status_code == 200
+
+    def test_rows_for_polling(self):
+        self.contest.participants.add(self.user)
+        scoreboard.rebuild_scoreboard(self.contest)
+        self.client.force_login(self.user)
+
+        result = self.client.get(reverse('contest_scoreboard_rows', args=(self.contest.id,))).json()
+        assert result['running']
+        assert [row['username'] for row in result['scores']] == ['test']
+        assert result['user_place'] == 1
+
+
+class UserScoreTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.client.force_login(self.user)
+        self.task = Task.objects.create(name='task', flag='flag', cost=100, is_published=True)
+        get_redis_connection('default').delete(submissions.get_attempts_key(self.user.id, self.task.id))
+        permissions.forget_all_permissions(self.user.id)
+
+    def get_score(self):
+        self.user.refresh_from_db()
+        return self.user.score, self.user.solved_count
+
+    def test_solve_updates_score_once(self):
+        for _ in range(2):
+            self.client.post(reverse('task_submit', kwargs={'task_id': self.task.id}), {'flag': 'flag'})
+        assert self.get_score() == (100, 1)
+
+    def test_task_changes_update_score(self):
+        self.task.solved_by.add(self.user)
+
+        self.task.cost = 250
+        self.task.save()
+        assert self.get_score() == (250, 1)
+
+        self.task.is_published = False
+        self.task.save()
+        assert self.get_score() == (0, 0)
+
+        self.user.solved_tasks.add(Task.objects.create(name='other', flag='flag', cost=30, is_published=True))
+        assert self.get_score() == (30, 1)
+
+        User.objects.update(score=0, solved_count=0)
+        call_command('recalculate_scores')
+        assert self.get_score() == (30, 1)
+
+        self.user.solved_tasks.clear()
+        assert self.get_score() == (0, 0)
+
+
+class SidebarCacheTestCase(TestCase):
+    def setUp(self):
+        invalidate_sidebar_cache(TOP_USERS_CACHE_KEY, UPCOMING_CONTESTS_CACHE_KEY, RUNNING_CONTESTS_CACHE_KEY)
+
+    def test_contest_changes_invalidate_cache(self):
+        assert len(running_contests(None)['running_contests']) == 0
+
+        contest = Contest.objects.create(title='contest', is_published=True, is_running=True)
+        assert list(running_contests(None)['running_contests']) == [contest]
+
+        contest.delete()
+        assert len(running_contests(None)['running_contests']) == 0
+
+    def test_top_users_are_cached(self):
+        User.objects.create(username='first', email='first@email.com', rating=1600)
+        assert [user.username for user in top_users(None)['top_users']] == ['first']
+
+        User.objects.create(username='second', email='second@email.com', rating=1700)
+        assert [user.username for user in top_users(None)['top_users']] == ['first']
+
+        invalidate_sidebar_cache(TOP_USERS_CACHE_KEY)
+        assert [user.username for user in top_users(None)['top_users']] == ['second', 'first']
+
+
+class FlagSubmissionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.client.force_login(self.user)
+        self.task = Task.objects.create(name='task', flag='flag', cost=100, is_published=True)
+        get_redis_connection('default').delete(
+            submissions.get_attempts_key(self.user.id, self.task.id),
+            SUBMISSION_QUEUE_KEY,
+            SUBMISSION_FLUSH_LOCK_KEY
+        )
+        permissions.forget_all_permissions(self.user.id)
+
+    def submit(self, flag):
+        return self.client.post(reverse('task_submit', kwargs={'task_id': self.task.id}), {'flag': flag}).json()
+
+    def test_flag_change_is_picked_up(self):
+        assert self.submit('new_flag')['success'] is False
+
+        self.task.flag = 'new_flag'
+        self.task.save()
+        assert self.submit('new_flag')['success'] is True
+        assert self.task.solved_by.filter(id=self.user.id).exists()
+
+    def test_solve_is_idempotent(self):
+        now = timezone.now()
+        assert submissions.solve_task(self.task.id, self.user, now)
+        assert not submissions.solve_task(self.task.id, self.user, now)
+
+        self.user.refresh_from_db()
+        assert (self.user.score, self.user.solved_count, self.user.last_solve) == (100, 1, now)
+
+    def test_submissions_are_throttled(self):
+        with self.settings(FLAG_SUBMISSION_LIMIT=3):
+            for _ in range(3):
+                assert self.submit('wrong')['errors']['flag'] == 'Invalid flag'
+            assert self.submit('flag')['success'] is False
+        assert not self.task.solved_by.exists()
+
+    def test_submissions_are_logged(self):
+        self.submit('wrong')
+        self.submit('flag')
+        assert not Submission.objects.exists()
+
+        flush_submissions()
+        assert list(Submission.objects.order_by('timestamp').values_list('user_id', 'task_id', 'correct', 'ip')) == [
+            (self.user.id, self.task.id, False, '127.0.0.1'),
+            (self.user.id, self.task.id, True, '127.0.0.1')
+        ]
+        assert get_redis_connection('default').llen(SUBMISSION_QUEUE_KEY) == 0
+
+    def test_failed_flush_keeps_submissions(self):
+        self.submit('wrong')
+        with mock.patch('website.tasks.save_submissions', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                flush_submissions()
+        assert get_redis_connection('default').llen(SUBMISSION_QUEUE_KEY) == 1
+
+        flush_submissions()
+        assert Submission.objects.count() == 1
+        assert get_redis_connection('default').llen(SUBMISSION_QUEUE_KEY) == 0
+
+    def test_flush_keeps_lock_of_another_worker(self):
+        connection = get_redis_connection('default')
+
+        def expire_lock(items):
+            # the lock expired during a slow flush and another worker took it
+            connection.set(SUBMISSION_FLUSH_LOCK_KEY, 'other')
+
+        self.submit('wrong')
+        with mock.patch('website.tasks.save_submissions', side_effect=expire_lock):
+            flush_submissions()
+        assert connection.get(SUBMISSION_FLUSH_LOCK_KEY) == b'other'
+
+    def test_flag_types(self):
+        self.task.flag_type = 'regex'
+        self.task.flag = r'flag\{[0-9]+\}'
+        self.task.save()
+        assert self.submit('flag{abc}')['success'] is False
+        assert self.submit('flag{123}')['success'] is True
+
+    def test_only_digests_are_cached(self):
+        self.submit('wrong')
+        flag_type, cached = cache.get(submissions.get_flag_key(self.task.id))
+        assert flag_type == 'exact'
+        assert 'flag' not in cached
+
+    def test_invalid_regex_is_rejected(self):
+        self.task.flag_type = 'regex'
+        self.task.flag = 'flag('
+        with self.assertRaises(ValidationError):
+            self.task.full_clean()
+
+        self.task.save()
+        assert self.submit('flag(')['success'] is False
+
+    def test_dynamic_flag(self):
+        self.task.flag_type = 'dynamic'
+        self.task.flag = 'secret'
+        self.task.save()
+        assert self.submit(get_dynamic_flag('secret', self.user.id + 1))['success'] is False
+        assert self.submit(get_dynamic_flag('secret', self.user.id))['success'] is True
+
+
+class FlagMatcherTestCase(SimpleTestCase):
+    def test_matchers(self):
+        assert get_matcher('exact', 'Flag').match('Flag', 1)
+        assert not get_matcher('exact', 'Flag').match('flag', 1)
+        assert get_matcher('iexact', 'Flag').match('fLAG', 1)
+        assert get_matcher('multiple', 'first second').match('second', 1)
+        assert not get_matcher('multiple', 'first second').match('first second', 1)
+        assert not get_matcher('regex', 'fl.g').match('flag!', 1)
+        assert get_matcher('regex', 'fl.g') is get_matcher('regex', 'fl.g')
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.delete_pattern('page_*')
+
+        now = timezone.now()
+        for i in range(8):
+            User.objects.create(
+                username='user{}'.format(i),
+                email='user{}@email.com'.format(i),
+                score=100 * (i % 3),
+                last_solve=now - timezone.timedelta(minutes=i % 2) if i % 4 else None
+            )
+
+    def get_usernames(self, page):
+        response = self.client.get(reverse('users_top_view_with_page', kwargs={'page': page}))
+        return [user.username for user in response.context['users']]
+
+    def test_pages_follow_ordering(self):
+        expected = list(User.objects.exclude(
+            username='AnonymousUser'
+        ).order_by(
+            '-score',
+            F('last_solve').asc(nulls_last=True),
+            'id'
+        ).values_list(
+            'username',
+            flat=True
+        ))
+
+        with self.settings(USERS_ON_PAGE=3):
+            # pages 2 and 3 are read by cursors cached while rendering the previous page
+            assert sum((self.get_usernames(page) for page in range(1, 4)), []) == expected
+            assert cache.get(get_cursor_key(page_counts.USERS_TOP, page_counts.get_version(page_counts.USERS_TOP), 3))
+
+            cache.delete_pattern('page_cursor:*')
+            assert self.get_usernames(3) == expected[6:]
+            assert self.client.get(reverse('users_top_view')).context['page_count'] == 3
+
+    def test_cursors_are_dropped_when_list_changes(self):
+        with self.settings(USERS_ON_PAGE=3):
+            self.get_usernames(1)
+            version = page_counts.get_version(page_counts.USERS_TOP)
+            assert cache.get(get_cursor_key(page_counts.USERS_TOP, version, 2)) is not None
+
+            # a solve moves the user up, the cursor of page 2 no longer follows the first page
+            task = Task.objects.create(name='task', flag='flag', cost=1000, is_published=True)
+            user = User.objects.get(username='user7')
+            submissions.solve_task(task.id, user, timezone.now())
+            assert page_counts.get_version(page_counts.USERS_TOP) != version
+
+            response = self.client.get(reverse('users_top_view_with_page', kwargs={'page': 2}))
+            assert response.context['start_number'] == 3
+            assert [u.username for u in response.context['users']] == list(User.objects.exclude(
+                username='AnonymousUser'
+            ).order_by(
+                '-score',
+                F('last_solve').asc(nulls_last=True),
+                'id'
+            ).values_list(
+                'username',
+                flat=True
+            )[3:6])
+
+        version = page_counts.get_version(page_counts.TASKS_ARCHIVE)
+        page_counts.invalidate_counts(page_counts.TASKS_ARCHIVE)
+        assert page_counts.get_version(page_counts.TASKS_ARCHIVE) != version
+
+    def test_solve_drops_rating_top_cursors(self):
+        group_top = page_counts.GROUP_USERS_RATING_TOP.format(1)
+        version = page_counts.get_version(page_counts.USERS_RATING_TOP)
+        assert page_counts.get_version(group_top) == version
+
+        # users share the default rating, the solve moves one of them by last_solve
+        task = Task.objects.create(name='task', flag='flag', is_published=True)
+        submissions.solve_task(task.id, User.objects.get(username='user0'), timezone.now())
+        assert page_counts.get_version(page_counts.USERS_RATING_TOP) != version
+        assert page_counts.get_version(group_top) != version
+
+
+class PageCountTestCase(TestCase):
+    def setUp(self):
+        cache.delete_pattern('page_*')
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.task = Task.objects.create(name='task', flag='flag', is_published=True)
+
+    def test_counts_are_cached_and_invalidated(self):
+        queryset = self.task.solved_by.all()
+        list_key = page_counts.TASK_SOLVED.format(self.task.id)
+        assert page_counts.get_count(queryset, list_key) == 0
+
+        with self.assertNumQueries(0):
+            assert page_counts.get_count(queryset, list_key) == 0
+
+        self.task.solved_by.add(self.user)
+        assert page_counts.get_count(queryset, list_key) == 1
+
+        solved_tasks_key = page_counts.USER_SOLVED_TASKS.format(self.user.id)
+        assert page_counts.get_count(self.user.solved_tasks.all(), solved_tasks_key) == 1
+        other = Task.objects.create(name='other', flag='flag', is_published=True)
+        submissions.solve_task(other.id, self.user, timezone.now())
+        assert page_counts.get_count(self.user.solved_tasks.all(), solved_tasks_key) == 2
+
+        tasks = Task.objects.filter(is_published=True)
+        assert page_counts.get_count(tasks, page_counts.TASKS_ARCHIVE) == 2
+        other.delete()
+        assert page_counts.get_count(tasks, page_counts.TASKS_ARCHIVE) == 1
+
+
+class AnonymousPageCacheTestCase(TestCase):
+    def setUp(self):
+        page_cache.bump_generation()
+        Task.objects.create(name='first', flag='flag', is_published=True)
+
+    def test_archive_is_cached_until_publication(self):
+        url = reverse('task_archive_view')
+        assert b'first' in self.client.get(url).content
+
+        with self.assertNumQueries(0):
+            assert b'first' in self.client.get(url).content
+
+        Task.objects.create(name='second', flag='flag', is_published=True)
+        assert b'second' in self.client.get(url).content
+
+    def test_authenticated_users_are_not_cached(self):
+        self.client.force_login(User.objects.create(username='test', email='test@email.com'))
+        self.client.get(reverse('task_archive_view'))
+        assert page_cache.get_page(self.client.get(reverse('task_archive_view')).wsgi_request) is None
+
+
+def forget_all_solved_tasks():
+    redis = get_redis_connection('default')
+    keys = redis.keys(submissions.get_solved_tasks_key('*'))
+    if keys:
+        redis.delete(*keys)
+
+
+class TasksArchiveOverlayTestCase(TestCase):
+    def setUp(self):
+        forget_all_solved_tasks()
+        page_cache.bump_generation()
+        self.task = Task.objects.create(name='first', flag='flag', is_published=True)
+        self.solver = User.objects.create(username='solver', email='solver@email.com')
+        self.other = User.objects.create(username='other', email='other@email.com')
+        self.task.solved_by.add(self.solver)
+
+    def test_cached_page_is_shared_with_own_solved_flags(self):
+        url = reverse('task_archive_view')
+        self.client.force_login(self.solver)
+        assert self.client.get(url).context['tasks'][0].is_solved_by_user
+
+        self.client.force_login(self.other)
+        assert not self.client.get(url).context['tasks'][0].is_solved_by_user
+
+        tasks = page_cache.get_or_set('tasks_archive:1', list, 60)
+        assert [task.id for task in tasks] == [self.task.id]
+        assert submissions.get_solved_task_ids(self.other, [self.task.id]) == set()
+
+
+class SolvedTasksSetTestCase(TestCase):
+    def setUp(self):
+        forget_all_solved_tasks()
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.tasks = [
+            Task.objects.create(name=str(i), flag='flag', is_published=True, author=self.user) for i in range(3)
+        ]
+        self.tasks[0].solved_by.add(self.user)
+
+    def test_set_is_loaded_once_and_updated_on_solve(self):
+        task_ids = [task.id for task in self.tasks]
+        assert submissions.get_solved_task_ids(self.user, task_ids) == {self.tasks[0].id}
+
+        with self.assertNumQueries(0):
+            assert submissions.get_solved_task_ids(self.user, task_ids) == {self.tasks[0].id}
+
+        submissions.solve_task(self.tasks[1].id, self.user, timezone.now())
+        with self.assertNumQueries(0):
+            assert submissions.is_solved(self.user, self.tasks[1].id)
+
+        self.tasks[0].solved_by.remove(self.user)
+        assert submissions.get_solved_task_ids(self.user, task_ids) == {self.tasks[1].id}
+
+    def test_solve_before_load_is_not_lost(self):
+        submissions.solve_task(self.tasks[2].id, self.user, timezone.now())
+        assert submissions.get_solved_task_ids(self.user, [task.id for task in self.tasks]) == {
+            self.tasks[0].id,
+            self.tasks[2].id
+        }
+
+    def test_task_view_uses_filter(self):
+        self.client.force_login(self.user)
+        assert b'placeholder="Solved"' in self.client.get(reverse('task_view', args=(self.tasks[0].id,))).content
+        assert b'placeholder="Solved"' not in self.client.get(reverse('task_view', args=(self.tasks[1].id,))).content
+
+
+class TaskSolvedCountTestCase(TestCase):
+    def setUp(self):
+        forget_all_solved_tasks()
+        self.users = [User.objects.create(username=str(i), email='{}@email.com'.format(i)) for i in range(3)]
+        self.task = Task.objects.create(name='task', flag='flag', is_published=True)
+
+    def get_solved_count(self):
+        return Task.objects.values_list('solved_count', flat=True).get(id=self.task.id)
+
+    def test_counter_follows_solves(self):
+        submissions.solve_task(self.task.id, self.users[0], timezone.now())
+        submissions.solve_task(self.task.id, self.users[0], timezone.now())
+        assert self.get_solved_count() == 1
+
+        self.task.solved_by.add(self.users[1], self.users[2])
+        assert self.get_solved_count() == 3
+
+        self.users[2].solved_tasks.remove(self.task)
+        self.users[1].delete()
+        assert self.get_solved_count() == 1
+
+        self.task.save()
+        assert self.get_solved_count() == 1
+
+        Task.objects.update(solved_count=10)
+        call_command('recalculate_scores')
+        assert self.get_solved_count() == 1
+
+
+class ContestAccessTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@email.com')
+        Contest.objects.bulk_create([
+            Contest(title='running', is_published=True, is_running=True),
+            Contest(title='unstarted', is_published=True)
+        ])
+        self.running = Contest.objects.get(title='running')
+        self.unstarted = Contest.objects.get(title='unstarted')
+        contest_access.forget_contest(self.running.id)
+        contest_access.forget_contest(self.unstarted.id)
+
+    def get_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_public_contest_is_cached(self):
+        assert contest_access.get_visible_contest(self.get_request(AnonymousUser()), self.running.id) == self.running
+        with self.assertNumQueries(0):
+            assert contest_access.get_visible_contest(self.get_request(self.user), self.running.id) == self.running
+
+        self.running.title = 'renamed'
+        self.running.save()
+        assert contest_access.get_visible_contest(self.get_request(self.user), self.running.id).title == 'renamed'
+
+    def test_unstarted_contest_needs_permission(self):
+        assert contest_access.get_visible_contest(self.get_request(AnonymousUser()), self.unstarted.id) is None
+        assert contest_access.get_visible_contest(self.get_request(self.user), self.unstarted.id) is None
+
+        assign_perm('view_unstarted_contest', self.user, self.unstarted)
+        request = self.get_request(User.objects.get(id=self.user.id))
+        assert contest_access.get_visible_contest(request, self.unstarted.id) == self.unstarted
+        with self.assertNumQueries(0):
+            assert contest_access.get_visible_contest(request, self.unstarted.id) == self.unstarted
+
+    def test_missing_contest(self):
+        assert contest_access.get_visible_contest(self.get_request(self.user), 0) is None
+        self.client.force_login(self.user)
+        assert self.client.get(reverse('contest_view', args=(self.unstarted.id,))).status_code == 404
+        assert self.client.get(reverse('contest_scoreboard_view', args=(self.running.id,))).status_code == 200
+
+
+class ObjectPermissionCacheTestCase(TestCase):
+    def setUp(self):
+        permissions.forget_all_permissions()
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.tasks = [Task.objects.create(name=str(i), flag='flag') for i in range(3)]
+
+    def get_user(self):
+        return User.objects.get(id=self.user.id)
+
+    def test_permissions_are_loaded_once(self):
+        assign_perm('change_task', self.user, self.tasks[0])
+        user = self.get_user()
+        assert user.has_perm('change_task', self.tasks[0])
+
+        with self.assertNumQueries(0):
+            assert user.has_perm('website.change_task', self.tasks[0])
+            assert not user.has_perm('change_task', self.tasks[1])
+            assert not user.has_perm('view_task', self.tasks[2])
+
+    def test_assign_and_remove_invalidate(self):
+        assert not self.get_user().has_perm('view_task', self.tasks[1])
+
+        assign_perm('view_task', self.user, self.tasks[1])
+        assert self.get_user().has_perm('view_task', self.tasks[1])
+
+        remove_perm('view_task', self.user, self.tasks[1])
+        assert not self.get_user().has_perm('view_task', self.tasks[1])
+
+    def test_group_permissions(self):
+        group = Group.objects.create(name='authors')
+        assign_perm('view_task', group, self.tasks[2])
+        assert not self.get_user().has_perm('view_task', self.tasks[2])
+
+        self.user.groups.add(group)
+        assert self.get_user().has_perm('view_task', self.tasks[2])
+        assert permissions.get_perms(self.get_user(), self.tasks[2]) == {'view_task'}
+
+    def test_self_permissions_are_not_stored(self):
+        other = User.objects.create(username='other', email='other@email.com')
+        user = self.get_user()
+        user.save()
+        assert not UserObjectPermission.objects.filter(user=user).exists()
+
+        assert user.has_perm('view_tasks_archive', user)
+        assert user.has_perm('view_contests_archive', user)
+        assert not user.has_perm('view_tasks_archive', other)
+
+        self.client.force_login(user)
+        assert self.client.get(reverse('user_tasks_view', args=(user.username,))).status_code == 200
+        assert self.client.get(reverse('user_tasks_view', args=(other.username,))).status_code == 403
+
+
+class ContestCreationTestCase(TestCase):
+    def setUp(self):
+        permissions.forget_all_permissions()
+        self.user = User.objects.create(username='test', email='test@email.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='add_contest'))
+        self.client.force_login(self.user)
+        self.tags = [TaskTag.objects.create(name='tag{}'.format(i)) for i in range(2)]
+        self.tasks = [Task.objects.create(name=str(i), flag='flag') for i in range(20)]
+        for task in self.tasks:
+            assign_perm('view_task', self.user, task)
+
+    def create_contest(self, tasks, tags=None):
+        tags = tags or [self.tags[i % 2].name for i in range(len(tasks))]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('create_contest'), {
+                'title': 'contest',
+                'description': 'description',
+                'start_time': '2030-01-01 10:00',
+                'end_time': '2030-01-01 12:00',
+                'tasks': [task.id for task in tasks],
+                'tags': tags,
+                'costs': [100] * len(tasks)
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_depend_on_task_count(self):
+        # the first request also fills permission and content type caches
+        assert self.create_contest(self.tasks[:1])[0]['success']
+        result, few_queries = self.create_contest(self.tasks[:2])
+        assert result['success']
+        result, many_queries = self.create_contest(self.tasks)
+        assert result['success']
+        assert few_queries == many_queries
+
+        contest = Contest.objects.order_by('-id').first()
+        assert contest.tasks.count() == 20
+        assert set(contest.contest_task_relationship.values_list('cost', flat=True)) == {100}
+
+    def test_invalid_tasks_and_tags(self):
+        other = Task.objects.create(name='other', flag='flag')
+        assert self.create_contest([self.tasks[0], other])[0]['errors'] == {'tasks': 'Invalid task.'}
+        assert 'tags' in self.create_contest(self.tasks[:2], ['tag0', 'missing'])[0]['errors']
+        assert not Contest.objects.exists()
+
+
+class TaskTagsTestCase(TestCase):
+    def setUp(self):
+        task_tags.forget_tag_ids()
+        self.task = Task.objects.create(name='task', flag='flag')
+        TaskTag.objects.create(name='test_web')
+
+    def get_tags(self):
+        return set(self.task.tags.values_list('name', flat=True))
+
+    def test_tags_are_upserted_and_diffed(self):
+        tag_count = TaskTag.objects.count()
+        task_tags.set_task_tags(self.task, ['test_web', 'test_crypto', 'test_pwn', 'test_crypto'])
+        assert self.get_tags() == {'test_web', 'test_crypto', 'test_pwn'}
+        assert TaskTag.objects.count() == tag_count + 2
+
+        through = Task.tags.through
+        kept = through.objects.get(task=self.task, tasktag__name='test_web').id
+        task_tags.set_task_tags(self.task, ['test_web', 'test_reverse'])
+        assert self.get_tags() == {'test_web', 'test_reverse'}
+        assert through.objects.get(task=self.task, tasktag__name='test_web').id == kept
+
+        with self.assertNumQueries(2):
+            task_tags.set_task_tags(self.task, ['test_web', 'test_reverse'])
+
+    def test_search_uses_cached_tags(self):
+        task_tags.get_or_create_tags(['test_web2', 'test_crypto'])
+        task_tags.search('', 10)
+        with self.assertNumQueries(0):
+            assert task_tags.search('test_we', 10) == ['test_web', 'test_web2']
+
+        TaskTag.objects.filter(name='test_web2').delete()
+        assert task_tags.search('test_we', 10) == ['test_web']
@@ -82,6 +82,8 @@ urlpatterns = [
     path('contest/<int:contest_id>/', ContestMainView.as_view(), name='contest_view'),
     path('contest/<int:contest_id>/register/', register_for_contest, name='register_for_contest'),
     path('contest/<int:contest_id>/scoreboard/', ContestScoreboardView.as_view(), name='contest_scoreboard_view'),
+    path('contest/<int:contest_id>/scoreboard/stream/', contest_scoreboard_stream, name='contest_scoreboard_stream'),
+    path('contest/<int:contest_id>/scoreboard/rows/', contest_scoreboard_rows, name='contest_scoreboard_rows'),
     path('contest/<int:contest_id>/task/<int:task_id>/', ContestTaskView.as_view(), name='contest_task_view'),
     path('contest/<int:contest_id>/task/<int:task_id>/submit/', submit_contest_flag, name='contest_task_submit'),
 
@@ -1,19 +1,22 @@
 from django.conf import settings
-from django.db.models import IntegerField, BooleanField
+from django.db.models import BooleanField
 from django.db.models import Q, Sum, Case, When, Value as V, Prefetch, Count, Subquery, OuterRef
-from django.http import Http404
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import reverse
 from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import TemplateView
-from django.utils.datetime_safe import datetime
+from django.utils import timezone
 from guardian.shortcuts import get_objects_for_user, assign_perm
 
 from website.decorators import custom_login_required as login_required
 from website.forms import ContestForm
+from website import contest_access, page_counts, permissions, scoreboard, submissions
 from website.mixins import AjaxPermissionsRequiredMixin
-from website.models import User, Contest, Task, TaskTag, ContestTaskRelationship
-from .view_classes import PagedTemplateView, UsernamePagedTemplateView, GetPostTemplateViewWithAjax
+from website.models import User, Contest, Task, TaskTag, ContestTaskRelationship, ContestScore
+from .view_classes import AnonymousPageCacheMixin, PagedTemplateView, UsernamePagedTemplateView
+from .view_classes import GetPostTemplateViewWithAjax
 
 
 @require_GET
@@ -42,40 +45,133 @@ def get_task(request):
 @login_required
 def submit_contest_flag(request, contest_id, task_id):
     flag = request.POST.get('flag', '').strip()
-    contest = Contest.objects.filter(Q(is_running=True) | Q(is_finished=True),
-                                     id=contest_id,
-                                     is_published=True
-                                     ).prefetch_related('tasks').first()
-    if not contest:
-        raise Http404()
 
-    task = contest.tasks.filter(id=task_id).first()
-    if not task:
+    response_dict = dict()
+    if submissions.is_throttled(request.user.id, task_id):
+        response_dict['success'] = False
+        response_dict['errors'] = {'flag': 'Too many attempts, try again later'}
+        return JsonResponse(response_dict)
+
+    relationship = ContestTaskRelationship.objects.filter(
+        Q(contest__is_running=True) | Q(contest__is_finished=True),
+        contest_id=contest_id,
+        contest__is_published=True,
+        task_id=task_id
+    ).select_related(
+        'contest'
+    ).only(
+        'cost',
+        'task_id',
+        'is_dynamic',
+        'initial_cost',
+        'min_cost',
+        'decay',
+        'contest__start_time',
+        'contest__end_time',
+        'contest__scoreboard_freeze',
+        'contest__is_running'
+    ).first()
+    if not relationship:
         raise Http404()
 
-    response_dict = dict()
-    if flag == task.flag:
-        response_dict['success'] = True
-        if not request.user.has_perm('change_task', task):
-            if contest.is_running:
-                relationship = task.contest_task_relationship.filter(contest=contest).first()
-
-                if not relationship:
-                    raise Http404()
-                if not relationship.solved.filter(id=request.user.id).exists():
-                    relationship.solved.add(request.user)
-            if not task.solved_by.filter(id=request.user.id).exists():
-                task.solved_by.add(request.user)
-                request.user.last_solve = datetime.now()
-                request.user.save()
-
-        response_dict['next'] = reverse('contest_view', kwargs={'contest_id': contest_id})
-    else:
+    now = timezone.now()
+    correct = bool(submissions.check_flag(task_id, request.user.id, flag))
+    submissions.log_submission(request.user.id, task_id, relationship.contest_id, correct, now,
+                               request.META.get('REMOTE_ADDR'))
+
+    if not correct:
         response_dict['success'] = False
         response_dict['errors'] = {'flag': 'Invalid flag'}
+        return JsonResponse(response_dict)
+
+    response_dict['success'] = True
+    if not request.user.has_perm('change_task', Task(id=task_id)):
+        contest = relationship.contest
+        delta = submissions.solve_contest_task(relationship, request.user, now) if contest.is_running else None
+        if delta is not None:
+            if delta:
+                scoreboard.set_scores(contest, ContestScore.objects.filter(
+                    contest=contest,
+                    user__contest_task_relationship=relationship
+                ).exclude(
+                    user=request.user
+                ).values_list(
+                    'user_id',
+                    'points',
+                    'last_solve'
+                ))
+
+            score = ContestScore.objects.filter(
+                contest=contest,
+                user=request.user
+            ).values_list(
+                'points',
+                'last_solve'
+            ).first()
+            if score:
+                scoreboard.update_scoreboard(contest, request.user, *score)
+                if not contest.is_scoreboard_frozen:
+                    scoreboard.publish_update(contest, request.user, score[0])
+        submissions.solve_task(task_id, request.user, now)
+
+    response_dict['next'] = reverse('contest_view', kwargs={'contest_id': contest_id})
     return JsonResponse(response_dict)
 
 
+@require_GET
+@login_required
+def contest_scoreboard_stream(request, contest_id):
+    if not settings.SCOREBOARD_STREAM_ENABLED:
+        raise Http404()
+
+    contest = contest_access.get_visible_contest(request, contest_id)
+    if not contest or not contest.is_running or contest.is_scoreboard_frozen:
+        raise Http404()
+
+    if not request.user.has_perm('can_participate_in_contest', contest):
+        raise PermissionDenied()
+
+    if not scoreboard.acquire_stream_slot(contest.id, request.user.id, settings.SCOREBOARD_STREAMS_PER_USER,
+                                          settings.SCOREBOARD_STREAM_SLOT_TIMEOUT):
+        return HttpResponse('Too many scoreboard streams', status=429)
+
+    response = StreamingHttpResponse(
+        scoreboard.stream_slot_events(contest.id, request.user.id, settings.SCOREBOARD_STREAM_KEEPALIVE),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def contest_scoreboard_rows(request, contest_id):
+    """
+    Scoreboard page for polling clients, it is read from Redis and does not hold the worker.
+    """
+    contest = contest_access.get_visible_contest(request, contest_id)
+    if not contest:
+        raise Http404()
+
+    if not contest.is_running or contest.is_scoreboard_frozen:
+        return JsonResponse({'running': False})
+
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    start = (page - 1) * settings.USERS_ON_PAGE
+    result = {
+        'running': True,
+        'start_number': start,
+        'scores': scoreboard.get_scoreboard_rows(contest, start, start + settings.USERS_ON_PAGE)
+    }
+    if request.user.is_authenticated:
+        result['user_place'] = scoreboard.get_rank(contest.id, request.user.id)
+    return JsonResponse(result)
+
+
 @require_POST
 @login_required
 def register_for_contest(request, contest_id):
@@ -115,20 +211,12 @@ class ContestMainView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super(ContestMainView, self).get_context_data(**kwargs)
         contest_id = kwargs.get('contest_id')
-        contest = Contest.objects.filter(
-            Q(is_running=True) | Q(is_finished=True),
-            id=contest_id,
-            is_published=True
-        ).order_by().union(
-            get_objects_for_user(self.request.user, 'view_unstarted_contest', Contest).filter(
-                id=contest_id
-            )
-        ).first()
+        contest = contest_access.get_visible_contest(self.request, contest_id)
         if not contest:
             raise Http404()
 
         tasks = contest.tasks.annotate(
-            solved_count=Count(
+            contest_solved_count=Count(
                 'contest_task_relationship__solved',
                 filter=Q(contest_task_relationship__solved__contests_participated=contest),
                 distinct=True
@@ -162,50 +250,35 @@ class ContestScoreboardView(PagedTemplateView):
         context = super(ContestScoreboardView, self).get_context_data(**kwargs)
         contest_id = kwargs.get('contest_id')
         page = context['page']
-        contest = Contest.objects.filter(
-            Q(is_running=True) | Q(is_finished=True),
-            id=contest_id,
-            is_published=True
-        ).order_by().union(
-            get_objects_for_user(self.request.user, 'view_unstarted_contest', Contest).filter(
-                id=contest_id
-            )
-        ).first()
+        contest = contest_access.get_visible_contest(self.request, contest_id)
 
         if not contest:
             raise Http404
 
-        users = contest.participants.prefetch_related(
-            Prefetch(
-                'contest_task_relationship',
-                queryset=ContestTaskRelationship.objects.only('contest', 'cost')
-            )
-        ).annotate(
-            cost_sum=Sum(
-                Case(
-                    When(
-                        contest_task_relationship__contest=contest,
-                        then='contest_task_relationship__cost'
-                    ),
-                    default=V(0),
-                    output_field=IntegerField()
-                )
-            ),
-        ).order_by(
-            '-cost_sum',
-            'last_solve',
-        )[(page - 1) * settings.USERS_ON_PAGE:page * settings.USERS_ON_PAGE]
-
         start_number = (page - 1) * settings.USERS_ON_PAGE
 
+        if contest.is_scoreboard_frozen:
+            snapshot = scoreboard.get_snapshot(contest)
+            scores = snapshot['rows'][start_number:start_number + settings.USERS_ON_PAGE]
+            context['user_place'] = snapshot['places'].get(self.request.user.id)
+        else:
+            scores = scoreboard.get_scoreboard_rows(contest, start_number, start_number + settings.USERS_ON_PAGE)
+            if self.request.user.is_authenticated:
+                context['user_place'] = scoreboard.get_rank(contest.id, self.request.user.id)
+
+        context['is_frozen'] = contest.is_scoreboard_frozen
+        context['use_stream'] = settings.SCOREBOARD_STREAM_ENABLED and self.request.user.has_perm(
+            'can_participate_in_contest', contest
+        )
+        context['poll_interval'] = settings.SCOREBOARD_POLL_INTERVAL
         context['start_number'] = start_number
         context['contest'] = contest
-        context['users'] = users
+        context['scores'] = scores
 
         return context
 
 
-class ContestsMainListView(PagedTemplateView):
+class ContestsMainListView(AnonymousPageCacheMixin, PagedTemplateView):
     template_name = 'index_templates/main_contests_list_view.html'
 
     def get_context_data(self, **kwargs):
@@ -214,17 +287,17 @@ class ContestsMainListView(PagedTemplateView):
 
         qs = Contest.objects.filter(is_published=True)
 
-        context['page_count'] = (qs.filter(
+        context['page_count'] = self.get_page_count(qs.filter(
             is_finished=True
-        ).count() + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+        ), settings.TASKS_ON_PAGE, page_counts.FINISHED_CONTESTS)
 
         context['running_contests'] = qs.filter(
             is_running=True
         ).all()
 
-        context['finished_contests'] = qs.filter(
+        context['finished_contests'] = self.get_page(qs.filter(
             is_finished=True
-        ).all()[(page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
+        ), ('-id',), page, settings.TASKS_ON_PAGE, page_counts.FINISHED_CONTESTS)
 
         return context
 
@@ -236,7 +309,7 @@ class UserContestListView(UsernamePagedTemplateView):
         context = super(UserContestListView, self).get_context_data(**kwargs)
         username = context['username']
         page = context['page']
-        user = User.objects.filter(username=username).annotate(contest_count=Count('contests')).first()
+        user = User.objects.filter(username=username).first()
 
         if not user:
             raise Http404()
@@ -244,16 +317,17 @@ class UserContestListView(UsernamePagedTemplateView):
         context['user'] = user
 
         if self.request.user.has_perm('view_contests_archive', user):
-            context['contests'] = user.contests.all()[
-                                  (page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
-            context['page_count'] = (user.contest_count + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+            list_key = page_counts.USER_CONTESTS.format(user.id)
+            context['contests'] = self.get_page(user.contests.all(), ('-id',), page, settings.TASKS_ON_PAGE, list_key)
+            context['page_count'] = self.get_page_count(user.contests.all(), settings.TASKS_ON_PAGE, list_key)
         else:
             qs = user.contests.filter(
                 is_published=True,
                 is_finished=True
             )
-            context['contests'] = qs.all()[(page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
-            context['page_count'] = (qs.count() + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+            list_key = page_counts.USER_FINISHED_CONTESTS.format(user.id)
+            context['contests'] = self.get_page(qs, ('-id',), page, settings.TASKS_ON_PAGE, list_key)
+            context['page_count'] = self.get_page_count(qs, settings.TASKS_ON_PAGE, list_key)
 
         return context
 
@@ -278,31 +352,40 @@ class ContestCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithA
             result['next'] = reverse('create_contest')
             return JsonResponse(result)
 
-        tasks = []
-        for i, task_id in enumerate(task_ids):
-
+        parsed_task_ids = []
+        for task_id in task_ids:
             try:
-                task_id = int(task_id)
+                parsed_task_ids.append(int(task_id))
             except ValueError:
-                continue
+                parsed_task_ids.append(None)
+
+        visible_tasks = permissions.filter_objects(
+            request.user,
+            'view_task',
+            Task.objects.filter(id__in=[task_id for task_id in parsed_task_ids if task_id is not None])
+        )
+        visible_tasks = {task.id: task for task in visible_tasks}
+        tags = {tag.name: tag for tag in TaskTag.objects.filter(name__in=task_tags)}
 
-            task = Task.objects.filter(id=task_id).first()
+        tasks = []
+        for task_id, tag_name, cost in zip(parsed_task_ids, task_tags, task_costs):
+            if task_id is None:
+                continue
 
-            if not task or not request.user.has_perm('view_task', task):
+            task = visible_tasks.get(task_id)
+            if not task:
                 result['success'] = False
                 result['errors'] = {'tasks': 'Invalid task.'}
                 result['next'] = reverse('create_contest')
                 return JsonResponse(result)
 
-            tag_name = task_tags[i]
-            tag = TaskTag.objects.filter(name=tag_name).first()
+            tag = tags.get(tag_name)
             if not tag:
                 result['success'] = False
                 result['errors'] = {'tags': 'Invalid tag, only existing tags are allowed.'}
                 result['next'] = reverse('create_contest')
                 return JsonResponse(result)
 
-            cost = task_costs[i]
             try:
                 cost = int(cost)
                 if cost < 0 or cost > 9999:
@@ -318,12 +401,9 @@ class ContestCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithA
         form = ContestForm(request.POST, user=request.user)
         if form.is_valid():
             contest = form.save()
-            for task in tasks:
-                relationship = ContestTaskRelationship(task=task[0],
-                                                       contest=contest,
-                                                       tag=task[1],
-                                                       cost=task[2])
-                relationship.save()
+            ContestTaskRelationship.objects.bulk_create([
+                ContestTaskRelationship(task=task, contest=contest, tag=tag, cost=cost) for task, tag, cost in tasks
+            ])
 
             assign_perm('change_contest', request.user, contest)
             assign_perm('view_unstarted_contest', request.user, contest)
@@ -347,15 +427,7 @@ class ContestTaskView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super(ContestTaskView, self).get_context_data(**kwargs)
         contest_id = kwargs.get('contest_id')
-        contest = Contest.objects.filter(
-            Q(is_running=True) | Q(is_finished=True),
-            id=contest_id,
-            is_published=True
-        ).order_by().union(
-            get_objects_for_user(self.request.user, 'view_unstarted_contest', Contest).filter(
-                id=contest_id
-            )
-        ).first()
+        contest = contest_access.get_visible_contest(self.request, contest_id)
         if not contest:
             raise Http404
 
@@ -2,8 +2,9 @@ from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import render, redirect
 
+from website import page_counts
 from website.models import Post
-from .view_classes import PagedTemplateView
+from .view_classes import AnonymousPageCacheMixin, PagedTemplateView
 
 
 def test_view(request):
@@ -15,7 +16,7 @@ def debug_view(request):
     return redirect('test_view')
 
 
-class MainView(PagedTemplateView):
+class MainView(AnonymousPageCacheMixin, PagedTemplateView):
     template_name = 'index_templates/index.html'
 
     def get_context_data(self, **kwargs):
@@ -26,13 +27,11 @@ class MainView(PagedTemplateView):
             is_important=True
         )
 
-        context['posts'] = qs.order_by(
-            '-created'
-        ).select_related(
+        context['posts'] = self.get_page(qs.select_related(
             'author'
-        ).all()[(page - 1) * 10: page * 10]
+        ), ('-created', '-id'), page, settings.POSTS_ON_PAGE, page_counts.MAIN_POSTS)
 
-        context['post_count'] = qs.count()
+        context['post_count'] = self.get_count(qs, page_counts.MAIN_POSTS)
 
         context['page_count'] = (context['post_count'] + settings.POSTS_ON_PAGE - 1) // settings.POSTS_ON_PAGE
         return context
@@ -1,13 +1,13 @@
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count
 from django.http import Http404, JsonResponse
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
+from website import page_counts
 from website.decorators import custom_login_required as login_required
 from website.forms import PostCreationForm, CommentCreationForm
 from website.models import Post, User
@@ -48,22 +48,17 @@ class UserBlogView(PagedTemplateView):
 
         user = User.objects.filter(
             username=username
-        ).annotate(
-            post_count=Count(
-                'posts'
-            )
         ).first()
 
         if not user:
             raise Http404()
 
-        posts = user.posts.order_by(
-            '-created'
-        ).select_related(
+        list_key = page_counts.USER_BLOG.format(user.id)
+        posts = self.get_page(user.posts.select_related(
             'author'
-        ).all()[(page - 1) * 10: page * 10]
+        ), ('-created', '-id'), page, settings.POSTS_ON_PAGE, list_key)
 
-        page_count = (user.post_count + settings.POSTS_ON_PAGE - 1) // settings.POSTS_ON_PAGE
+        page_count = self.get_page_count(user.posts.all(), settings.POSTS_ON_PAGE, list_key)
         context['user'] = user
         context['posts'] = posts
         context['page_count'] = page_count
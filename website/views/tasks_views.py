@@ -1,10 +1,10 @@
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.db.models import Count
-from django.db.models import Sum, Case, When, BooleanField, Value as V
 from django.db.models.query import Prefetch
 from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.datetime_safe import datetime
 from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import TemplateView
@@ -14,8 +14,9 @@ from website.decorators import custom_login_required as login_required
 from website.forms import TaskForm, FileUploadForm
 from website.forms import TaskTagForm
 from website.mixins import CustomLoginRequiredMixin as LoginRequiredMixin, AjaxPermissionsRequiredMixin
-from website.models import User, Task, TaskTag, File
-from .view_classes import GetPostTemplateViewWithAjax, PagedTemplateView
+from website import page_cache, page_counts, submissions, task_tags
+from website.models import User, Task, File
+from .view_classes import AnonymousPageCacheMixin, GetPostTemplateViewWithAjax, PagedTemplateView
 
 
 @require_GET
@@ -24,7 +25,7 @@ def search_tags(request):
     if not tag:
         return HttpResponseBadRequest('tag not provided')
 
-    tags = list(TaskTag.objects.filter(name__startswith=tag).values_list('name', flat=True)[:10])
+    tags = task_tags.search(tag, 10)
     return JsonResponse({'tags': tags})
 
 
@@ -32,19 +33,26 @@ def search_tags(request):
 @login_required
 def submit_task(request, task_id):
     flag = request.POST.get('flag', '').strip()
-    task = Task.objects.filter(id=task_id).prefetch_related('solved_by').first()
-    if not task:
-        raise Http404()
 
     response_dict = dict()
-    if flag == task.flag:
+    if submissions.is_throttled(request.user.id, task_id):
+        response_dict['success'] = False
+        response_dict['errors'] = {'flag': 'Too many attempts, try again later'}
+        return JsonResponse(response_dict)
+
+    correct = submissions.check_flag(task_id, request.user.id, flag)
+    if correct is None:
+        raise Http404()
+
+    now = timezone.now()
+    submissions.log_submission(request.user.id, task_id, None, correct, now, request.META.get('REMOTE_ADDR'))
+
+    if correct:
         response_dict['success'] = True
-        if not task.solved_by.filter(id=request.user.id).exists() and not request.user.has_perm('change_task', task):
-            task.solved_by.add(request.user)
-            request.user.last_solve = datetime.now()
-            request.user.save()
+        if not request.user.has_perm('change_task', Task(id=task_id)):
+            submissions.solve_task(task_id, request.user, now)
 
-        response_dict['next'] = reverse('task_view', kwargs={'task_id': task.id})
+        response_dict['next'] = reverse('task_view', kwargs={'task_id': task_id})
     else:
         response_dict['success'] = False
         response_dict['errors'] = {'flag': 'Invalid flag'}
@@ -76,6 +84,11 @@ class TaskCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithAjax
         'add_task',
     )
 
+    def get_context_data(self, **kwargs):
+        context = super(TaskCreationView, self).get_context_data(**kwargs)
+        context['flag_types'] = Task.FLAG_TYPES
+        return context
+
     def handle_ajax(self, request, *args, **kwargs):
         task_form = TaskForm(request.POST, user=request.user)
         response_dict = dict()
@@ -92,8 +105,7 @@ class TaskCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithAjax
                     for tag_name in tags:
                         tag_form = TaskTagForm({'name': tag_name})
                         if tag_form.is_valid():
-                            tag, created = TaskTag.objects.get_or_create(**tag_form.cleaned_data)
-                            checked_tags.append(tag)
+                            checked_tags.append(tag_form.cleaned_data['name'])
                         else:
                             error = True
                             if not response_dict.get('errors'):
@@ -139,7 +151,7 @@ class TaskCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithAjax
                 return JsonResponse(response_dict)
 
             File.objects.bulk_create(checked_files)
-            task.tags.add(*checked_tags)
+            task_tags.set_task_tags(task, checked_tags)
 
             assign_perm('view_task', request.user, task)
             assign_perm('change_task', request.user, task)
@@ -155,43 +167,40 @@ class TaskCreationView(AjaxPermissionsRequiredMixin, GetPostTemplateViewWithAjax
             return JsonResponse(response_dict)
 
 
-class TasksArchiveView(PagedTemplateView):
+class TasksArchiveView(AnonymousPageCacheMixin, PagedTemplateView):
     template_name = 'index_templates/tasks_archive.html'
 
     def get_context_data(self, **kwargs):
         context = super(TasksArchiveView, self).get_context_data(**kwargs)
         page = context['page']
 
-        tasks = Task.objects.filter(
-            is_published=True
-        ).prefetch_related(
-            'tags'
-        ).annotate(
-            is_solved_by_user=Sum(
-                Case(
-                    When(
-                        solved_by__id=(self.request.user.id or -1),
-                        then=1
-                    ),
-                    default=V(0),
-                    output_field=BooleanField()
-                ),
-            ),
-            solved_count=Count(
-                'solved_by',
-                distinct=True
-            )
-        ).order_by(
-            '-publication_time', '-id'
-        ).all()[(page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
+        tasks = page_cache.get_or_set('tasks_archive:{}'.format(page), lambda: self.get_tasks(page),
+                                      settings.TASKS_ARCHIVE_CACHE_TIMEOUT)
+
+        solved_task_ids = submissions.get_solved_task_ids(self.request.user, [task.id for task in tasks])
+        for task in tasks:
+            task.is_solved_by_user = task.id in solved_task_ids
 
-        page_count = (Task.objects.filter(
-            is_published=True).count() + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+        page_count = self.get_page_count(Task.objects.filter(
+            is_published=True
+        ), settings.TASKS_ON_PAGE, page_counts.TASKS_ARCHIVE)
         context['start_number'] = (page - 1) * settings.TASKS_ON_PAGE
         context['tasks'] = tasks
         context['page_count'] = page_count
         return context
 
+    def get_tasks(self, page):
+        """
+        Returns the page of tasks, it is the same for every user and cached by get_context_data.
+        """
+        tasks = Task.objects.filter(
+            is_published=True
+        ).prefetch_related(
+            'tags'
+        )
+        return self.get_page(tasks, ('-publication_time', '-id'), page, settings.TASKS_ON_PAGE,
+                             page_counts.TASKS_ARCHIVE)
+
 
 class UserTasksView(LoginRequiredMixin, PagedTemplateView):
     template_name = 'profile_templates/users_tasks.html'
@@ -202,10 +211,6 @@ class UserTasksView(LoginRequiredMixin, PagedTemplateView):
         page = context['page']
         user = User.objects.filter(
             username=username
-        ).annotate(
-            task_count=Count(
-                'tasks'
-            )
         ).first()
         if not user:
             raise Http404()
@@ -213,17 +218,13 @@ class UserTasksView(LoginRequiredMixin, PagedTemplateView):
         if not self.request.user.has_perm('view_tasks_archive', user):
             raise PermissionDenied()
 
-        tasks = user.tasks.annotate(
-            solved_count=Count(
-                'solved_by'
-            )
-        ).prefetch_related(
+        tasks = user.tasks.prefetch_related(
             'tags'
-        ).order_by(
-            '-id'
-        ).all()[(page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
+        )
+        list_key = page_counts.USER_TASKS.format(user.id)
+        tasks = self.get_page(tasks, ('-id',), page, settings.TASKS_ON_PAGE, list_key)
 
-        page_count = (user.task_count + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+        page_count = self.get_page_count(user.tasks.all(), settings.TASKS_ON_PAGE, list_key)
 
         context['user'] = user
         context['tasks'] = tasks
@@ -259,6 +260,7 @@ class TaskEditView(LoginRequiredMixin, GetPostTemplateViewWithAjax):
             raise PermissionDenied()
 
         context['task'] = task
+        context['flag_types'] = Task.FLAG_TYPES
 
         return context
 
@@ -345,8 +347,7 @@ class TaskEditView(LoginRequiredMixin, GetPostTemplateViewWithAjax):
                     for tag_name in tags:
                         tag_form = TaskTagForm({'name': tag_name})
                         if tag_form.is_valid():
-                            tag, created = TaskTag.objects.get_or_create(**tag_form.cleaned_data)
-                            checked_tags.append(tag)
+                            checked_tags.append(tag_form.cleaned_data['name'])
                         else:
                             error = True
                             if not response_dict.get('errors'):
@@ -362,8 +363,7 @@ class TaskEditView(LoginRequiredMixin, GetPostTemplateViewWithAjax):
                 response_dict['success'] = False
                 return JsonResponse(response_dict)
 
-            task.tags.clear()
-            task.tags.add(*checked_tags)
+            task_tags.set_task_tags(task, checked_tags)
             task.files.remove(*list(File.objects.filter(id__in=list(remove_files)).all()))
             File.objects.bulk_create(checked_files)
             task.save()
@@ -390,20 +390,18 @@ class TaskSolvedView(PagedTemplateView):
 
         task = Task.objects.filter(
             id=task_id
-        ).prefetch_related(
-            'solved_by'
-        ).annotate(
-            solved_by_count=Count(
-                'solved_by'
-            )
+        ).only(
+            'id',
+            'solved_count'
         ).first()
 
         if not task:
             raise Http404()
 
-        users = task.solved_by.all()[(page - 1) * settings.USERS_ON_PAGE: page * settings.USERS_ON_PAGE]
+        list_key = page_counts.TASK_SOLVED.format(task.id)
+        users = self.get_page(task.solved_by.all(), ('id',), page, settings.USERS_ON_PAGE, list_key)
 
-        page_count = (task.solved_by_count + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
+        page_count = (task.solved_count + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
 
         context['task_id'] = task_id
         context['users'] = users
@@ -422,19 +420,14 @@ class UserSolvedTasksView(PagedTemplateView):
 
         user = User.objects.filter(
             username=username
-        ).annotate(
-            task_count=Count(
-                'solved_tasks'
-            )
         ).first()
 
         if not user:
             raise Http404()
 
-        tasks = user.solved_tasks.order_by(
-            '-id'
-        ).all()[(page - 1) * settings.TASKS_ON_PAGE: page * settings.TASKS_ON_PAGE]
-        page_count = (user.task_count + settings.TASKS_ON_PAGE - 1) // settings.TASKS_ON_PAGE
+        list_key = page_counts.USER_SOLVED_TASKS.format(user.id)
+        tasks = self.get_page(user.solved_tasks.all(), ('-id',), page, settings.TASKS_ON_PAGE, list_key)
+        page_count = self.get_page_count(user.solved_tasks.all(), settings.TASKS_ON_PAGE, list_key)
 
         context['user'] = user
         context['tasks'] = tasks
@@ -3,8 +3,6 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import SetPasswordForm
 from django.core.mail import send_mail
-from django.db.models import Sum, Value as V, Q
-from django.db.models.functions import Coalesce
 from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
@@ -12,12 +10,13 @@ from django.urls import reverse
 from django.views.decorators.http import require_GET
 from django.views.generic import TemplateView
 
+from website import page_counts
 from website.forms import RegistrationForm
 from website.forms import UserGeneralUpdateForm, UserSocialUpdateForm
 from website.mixins import CustomLoginRequiredMixin as LoginRequiredMixin
 from website.models import User
 from website.tokens import deserialize, serialize
-from .view_classes import GetPostTemplateViewWithAjax, PagedTemplateView
+from .view_classes import AnonymousPageCacheMixin, GetPostTemplateViewWithAjax, PagedTemplateView
 
 
 @require_GET
@@ -190,14 +189,6 @@ class UserInformationView(TemplateView):
         username = kwargs.get('username')
         user = User.objects.filter(
             username=username
-        ).annotate(
-            cost_sum=
-            Coalesce(
-                Sum(
-                    'solved_tasks__cost'
-                ),
-                V(0)
-            )
         ).select_related(
             'organization'
         ).first()
@@ -252,10 +243,11 @@ class FriendsView(LoginRequiredMixin, GetPostTemplateViewWithAjax, PagedTemplate
         context = super(FriendsView, self).get_context_data(**kwargs)
         page = context['page']
 
-        friends = self.request.user.friends.all()[(page - 1) * settings.USERS_ON_PAGE: page * settings.USERS_ON_PAGE]
+        list_key = page_counts.FRIENDS.format(self.request.user.id)
+        friends = self.get_page(self.request.user.friends.all(), ('id',), page, settings.USERS_ON_PAGE, list_key)
         context['friends'] = friends
 
-        page_count = (self.request.user.friends.count() + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
+        page_count = self.get_page_count(self.request.user.friends.all(), settings.USERS_ON_PAGE, list_key)
         context['page_count'] = page_count
 
         return context
@@ -309,21 +301,9 @@ class UserTopView(PagedTemplateView):
             groups__name='Administrators'
         )
 
-        users = qs.annotate(
-            cost_sum=Coalesce(
-                Sum(
-                    'solved_tasks__cost',
-                    filter=Q(solved_tasks__is_published=True),
-                ),
-                V(0)
-            )
-        ).order_by(
-            '-cost_sum',
-            'last_solve',
-            'id'
-        ).all()[(page - 1) * settings.USERS_ON_PAGE: page * settings.USERS_ON_PAGE]
+        users = self.get_page(qs, ('-score', 'last_solve', 'id'), page, settings.USERS_ON_PAGE, page_counts.USERS_TOP)
 
-        page_count = (qs.count() + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
+        page_count = self.get_page_count(qs, settings.USERS_ON_PAGE, page_counts.USERS_TOP)
 
         start_number = (page - 1) * settings.USERS_ON_PAGE
 
@@ -334,7 +314,7 @@ class UserTopView(PagedTemplateView):
         return context
 
 
-class UserRatingTopView(PagedTemplateView):
+class UserRatingTopView(AnonymousPageCacheMixin, PagedTemplateView):
     template_name = 'index_templates/users_rating_top.html'
 
     def get_context_data(self, **kwargs):
@@ -349,13 +329,10 @@ class UserRatingTopView(PagedTemplateView):
             groups__name='Administrators'
         )
 
-        users = qs.order_by(
-            '-rating',
-            'last_solve',
-            'id'
-        ).all()[(page - 1) * settings.USERS_ON_PAGE: page * settings.USERS_ON_PAGE]
+        users = self.get_page(qs, ('-rating', 'last_solve', 'id'), page, settings.USERS_ON_PAGE,
+                              page_counts.USERS_RATING_TOP)
 
-        page_count = (qs.count() + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
+        page_count = self.get_page_count(qs, settings.USERS_ON_PAGE, page_counts.USERS_RATING_TOP)
 
         start_number = (page - 1) * settings.USERS_ON_PAGE
 
@@ -390,13 +367,10 @@ class UserByGroupRatingTopView(PagedTemplateView):
             groups__name='Administrators'
         )
 
-        users = qs.order_by(
-            '-rating',
-            'last_solve',
-            'id'
-        ).all()[(page - 1) * settings.USERS_ON_PAGE: page * settings.USERS_ON_PAGE]
+        list_key = page_counts.GROUP_USERS_RATING_TOP.format(group_id)
+        users = self.get_page(qs, ('-rating', 'last_solve', 'id'), page, settings.USERS_ON_PAGE, list_key)
 
-        page_count = (qs.count() + settings.USERS_ON_PAGE - 1) // settings.USERS_ON_PAGE
+        page_count = self.get_page_count(qs, settings.USERS_ON_PAGE, list_key)
 
         start_number = (page - 1) * settings.USERS_ON_PAGE
 
@@ -1,6 +1,46 @@
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
 from django.http import Http404
 from django.views.generic.base import TemplateView
 
+from website import page_cache, page_counts
+
+
+def get_cursor_key(list_key, version, page):
+    return 'page_cursor:{}:{}:{}'.format(list_key, version, page)
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serves GET requests of anonymous users from cache. Pages are cached per URL and mobile flag
+    until page_cache.bump_generation or ANONYMOUS_PAGE_CACHE_TIMEOUT, responses that use
+    CSRF tokens or set cookies are not cached.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        response = page_cache.get_page(request)
+        if response is not None:
+            return response
+
+        response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        def cache_response(rendered):
+            if rendered.status_code == 200 and not rendered.cookies and not request.META.get('CSRF_COOKIE_USED'):
+                page_cache.set_page(request, rendered)
+
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(cache_response)
+        else:
+            cache_response(response)
+        return response
+
 
 class GetPostTemplateViewWithAjax(TemplateView):
 
@@ -16,6 +56,47 @@ class GetPostTemplateViewWithAjax(TemplateView):
         return self.handle_default(request, *args, **kwargs)
 
 
+def get_keyset_filter(model, ordering, values):
+    """
+    Returns Q selecting rows that come after the row with given values of ordering fields,
+    NULLs are last in ascending and first in descending order as in get_keyset_ordering.
+    """
+    after = []
+    same = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+
+        if value is None:
+            if descending:
+                after.append(same & Q(**{name + '__isnull': False}))
+            same &= Q(**{name + '__isnull': True})
+        else:
+            condition = Q(**{name + ('__lt' if descending else '__gt'): value})
+            if not descending and model._meta.get_field(name).null:
+                condition |= Q(**{name + '__isnull': True})
+            after.append(same & condition)
+            same &= Q(**{name: value})
+
+    return reduce(operator.or_, after)
+
+
+def get_keyset_ordering(model, ordering):
+    """
+    Returns ordering with NULL placement fixed for nullable fields, so it is the same in every database.
+    """
+    result = []
+    for field in ordering:
+        name = field.lstrip('-')
+        if not model._meta.get_field(name).null:
+            result.append(field)
+        elif field.startswith('-'):
+            result.append(F(name).desc(nulls_first=True))
+        else:
+            result.append(F(name).asc(nulls_last=True))
+    return result
+
+
 class PagedTemplateView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super(PagedTemplateView, self).get_context_data(**kwargs)
@@ -27,6 +108,38 @@ class PagedTemplateView(TemplateView):
         context['page'] = page
         return context
 
+    @staticmethod
+    def get_page(queryset, ordering, page, per_page, list_key):
+        """
+        Returns objects of the page, the last ordering field must be unique.
+
+        When a page is rendered, ordering values of its last object are cached as the cursor of
+        the next page, so following page links seeks by keyset instead of scanning OFFSET rows.
+        Pages without a cached cursor fall back to OFFSET. Cursors are kept under the list version,
+        so they are dropped with page_counts.invalidate_counts and page_counts.forget_cursors.
+        """
+        queryset = queryset.order_by(*get_keyset_ordering(queryset.model, ordering))
+
+        version = page_counts.get_version(list_key)
+        cursor = cache.get(get_cursor_key(list_key, version, page)) if page > 1 else None
+        if cursor is not None:
+            objects = list(queryset.filter(get_keyset_filter(queryset.model, ordering, cursor))[:per_page])
+        else:
+            objects = list(queryset[(page - 1) * per_page: page * per_page])
+
+        if len(objects) == per_page:
+            last = objects[-1]
+            cache.set(get_cursor_key(list_key, version, page + 1),
+                      [getattr(last, field.lstrip('-')) for field in ordering], settings.PAGE_CURSOR_TIMEOUT)
+        return objects
+
+    @staticmethod
+    def get_count(queryset, list_key):
+        return page_counts.get_count(queryset, list_key)
+
+    def get_page_count(self, queryset, per_page, list_key):
+        return (self.get_count(queryset, list_key) + per_page - 1) // per_page
+
 
 class UsernamePagedTemplateView(PagedTemplateView):
     def get_context_data(self, **kwargs):